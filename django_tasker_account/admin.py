@@ -1,10 +1,30 @@
 import json
 
+from django.contrib.auth import admin as auth_admin, forms as auth_forms
+from django.contrib.auth.models import User
 from django.contrib.sessions.models import Session
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+
+from . import canonical
 from .models import Profile, Oauth
 
 
+class UserChangeForm(auth_forms.UserChangeForm):
+    def clean_email(self):
+        # The canonical email is unique, checked before the save
+        email = self.cleaned_data.get('email')
+        if email and User.objects.filter(profile__email_canonical=canonical.canonical(email)).exclude(
+                pk=self.instance.pk).exists():
+            raise ValidationError(_("User with this email is already exists."))
+        return email
+
+
+class UserAdmin(auth_admin.UserAdmin):
+    form = UserChangeForm
+
+
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'language', 'gender', 'birth_date', 'phone', 'geobase')
 
@@ -36,3 +56,8 @@ class SessionAdmin(admin.ModelAdmin):
 admin.site.register(Profile, ProfileAdmin)
 admin.site.register(Session, SessionAdmin)
 admin.site.register(Oauth, OAuthAdmin)
+
+# Replaces the admin of django.contrib.auth, which is registered first when listed before this application
+if admin.site.is_registered(User):
+    admin.site.unregister(User)
+    admin.site.register(User, UserAdmin)
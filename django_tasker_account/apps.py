@@ -9,3 +9,7 @@ class DjangoTaskerAccountConfig(AppConfig):
     def ready(self):
         if not self.apps.is_installed('django_tasker_geobase'):
             raise Exception("Add in settings.py to section INSTALLED_APPS application django_tasker_geobase")
+
+        from . import blacklist, mail
+        blacklist.check()
+        mail.warm()
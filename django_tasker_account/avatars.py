@@ -0,0 +1,193 @@
+import logging
+import tempfile
+from datetime import timedelta
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from . import models, oauth
+
+logger = logging.getLogger('tasker_account')
+
+CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AvatarError(Exception):
+    pass
+
+
+def max_size() -> int:
+    return getattr(settings, 'TASKER_ACCOUNT_AVATAR_MAX_SIZE', 5 * 1024 * 1024)
+
+
+def enqueue(user: User, url: str) -> models.AvatarJob:
+    """
+    Schedules the import of the avatar, a user has at most one pending job
+
+    :param user: User
+    :param url: URL of the avatar at the provider
+    :returns: AvatarJob
+    """
+    job, created = models.AvatarJob.objects.update_or_create(
+        user=user,
+        defaults={'url': url, 'attempts': 0, 'run_after': timezone.now(), 'error': ''},
+    )
+    return job
+
+
+def claim(batch_size: int) -> list:
+    """
+    Claims the due jobs, a claimed job is hidden from other workers for TASKER_ACCOUNT_AVATAR_LEASE seconds
+
+    :param batch_size: maximum number of jobs
+    :returns: list of AvatarJob
+    """
+    now = timezone.now()
+    lease = getattr(settings, 'TASKER_ACCOUNT_AVATAR_LEASE', 60 * 5)
+
+    with transaction.atomic():
+        jobs = list(
+            models.AvatarJob.objects.select_for_update(skip_locked=True)
+            .filter(run_after__lte=now)
+            .order_by('run_after')[:batch_size]
+        )
+        run_after = now + timedelta(seconds=lease)
+        models.AvatarJob.objects.filter(id__in=[job.id for job in jobs]).update(run_after=run_after)
+
+    # The lease identifies the claim, enqueue() resets it for a newer avatar
+    for job in jobs:
+        job.run_after = run_after
+
+    return jobs
+
+
+def claimed(job: models.AvatarJob):
+    """
+    The job unless enqueue() has replaced it since the claim
+
+    :param job: claimed AvatarJob
+    :returns: QuerySet
+    """
+    return models.AvatarJob.objects.filter(id=job.id, url=job.url, run_after=job.run_after)
+
+
+def download(http: requests.Session, url: str):
+    """
+    Streams the image into a temporary file
+
+    :param http: session
+    :param url: URL of the image
+    :returns: temporary file and extension
+    :raise: AvatarError If the response is not an image or is larger than TASKER_ACCOUNT_AVATAR_MAX_SIZE
+    :raise: requests.RequestException If the download failed
+    """
+    limit = max_size()
+    with http.get(url, stream=True, timeout=oauth.timeout()) as response:
+        if response.status_code != 200:
+            raise AvatarError('Status {code}'.format(code=response.status_code))
+
+        content_type = response.headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+        extension = CONTENT_TYPES.get(content_type)
+        if extension is None:
+            raise AvatarError('Content type {type}'.format(type=content_type or None))
+
+        if int(response.headers.get('Content-Length') or 0) > limit:
+            raise AvatarError('Size {size}'.format(size=response.headers.get('Content-Length')))
+
+        stream = tempfile.TemporaryFile()
+        try:
+            size = 0
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise AvatarError('Size exceeds {limit}'.format(limit=limit))
+                stream.write(chunk)
+        except BaseException:
+            stream.close()
+            raise
+
+    stream.seek(0)
+    return stream, extension
+
+
+def run(job: models.AvatarJob, http: requests.Session) -> bool:
+    """
+    Imports the avatar of the job, the job is deleted on success or after TASKER_ACCOUNT_AVATAR_ATTEMPTS attempts
+
+    :param job: AvatarJob
+    :param http: session
+    :returns: True if the job is done
+    """
+    profile = models.Profile.objects.filter(user_id=job.user_id).first()
+    if profile is None:
+        logger.error("Avatar job dropped, profile not found user:{user}".format(user=job.user_id))
+        claimed(job).delete()
+        return False
+
+    if profile.avatar:
+        claimed(job).delete()
+        return True
+
+    try:
+        stream, extension = download(http, job.url)
+    except (AvatarError, requests.RequestException) as error:
+        job.attempts += 1
+        job.error = str(error)[:255]
+        logger.error("Avatar download failed user:{user}, attempt:{attempt}, error:{error}".format(
+            user=job.user_id, attempt=job.attempts, error=error,
+        ))
+
+        if isinstance(error, AvatarError) or job.attempts >= getattr(settings, 'TASKER_ACCOUNT_AVATAR_ATTEMPTS', 5):
+            claimed(job).delete()
+        else:
+            claimed(job).update(
+                attempts=job.attempts,
+                error=job.error,
+                run_after=timezone.now() + timedelta(seconds=60 * 2 ** job.attempts),
+            )
+        return False
+
+    with stream, transaction.atomic():
+        # A newer avatar scheduled meanwhile is imported by its own job
+        if not claimed(job).delete()[0]:
+            logger.info("Avatar job replaced user:{user}".format(user=job.user_id))
+            return True
+
+        profile.avatar.save('avatar' + extension, File(stream), save=False)
+        profile.save(update_fields=['avatar'])
+    return True
+
+
+def process(batch_size: int = 100) -> tuple:
+    """
+    Runs one batch of due jobs
+
+    :param batch_size: maximum number of jobs
+    :returns: number of the done and the failed jobs
+    """
+    done = failed = 0
+    jobs = claim(batch_size)
+    if not jobs:
+        return done, failed
+
+    with requests.Session() as http:
+        http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        for job in jobs:
+            if run(job, http):
+                done += 1
+            else:
+                failed += 1
+
+    return done, failed
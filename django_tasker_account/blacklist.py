@@ -0,0 +1,263 @@
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger('tasker_account')
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blacklist.txt')
+
+_lock = threading.Lock()
+_blacklists = {}
+
+
+def signature(source: str) -> bytes:
+    """
+    Header of the compiled file identifying the version of the domain list.
+    It starts with a zero byte, so the compiled file stays sorted.
+
+    :param source: path of the domain list
+    :returns: header line
+    """
+    stat = os.stat(source)
+    return '\0{mtime}:{size}'.format(mtime=stat.st_mtime_ns, size=stat.st_size).encode('ascii')
+
+
+def compile_file(source: str, target: str) -> int:
+    """
+    Compiles a domain list into a sorted file of unique domains, one per line.
+    Lines starting with # are comments.
+
+    :param source: path of the domain list
+    :param target: path of the compiled file, replaced atomically
+    :returns: number of domains
+    """
+    header = signature(source)
+    domains = set()
+    with open(source, encoding='utf-8') as stream:
+        for line in stream:
+            domain = line.split('#', 1)[0].strip().lower().lstrip('@').rstrip('.')
+            if domain:
+                domains.add(domain.encode('idna'))
+
+    directory = os.path.dirname(os.path.abspath(target))
+    fd, path = tempfile.mkstemp(dir=directory, prefix='.blacklist')
+    try:
+        # mkstemp creates the file readable by the owner only
+        with os.fdopen(fd, 'wb') as stream:
+            stream.write(b'\n'.join([header] + sorted(domains)))
+            stream.flush()
+            os.fsync(stream.fileno())
+        os.replace(path, target)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    return len(domains)
+
+
+def check_source(source: str) -> str:
+    """
+    Checks the domain list exists
+
+    :param source: path of the domain list
+    :returns: path
+    :raise: ImproperlyConfigured If the file is not found
+    """
+    if not os.path.isfile(source):
+        raise ImproperlyConfigured("TASKER_ACCOUNT_EMAIL_BLACKLIST file not found: {path}".format(path=source))
+    return source
+
+
+def data_dir() -> str:
+    """
+    Private directory of the compiled files, created with mode 0700
+
+    :returns: TASKER_ACCOUNT_DATA_DIR, or django_tasker_account in the cache directory of the user
+    :raise: ImproperlyConfigured If the directory can not be created, belongs to another user or is writable by others
+    """
+    path = getattr(settings, 'TASKER_ACCOUNT_DATA_DIR', None) or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+        'django_tasker_account',
+    )
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+    except OSError as error:
+        raise ImproperlyConfigured("Directory can not be created: {path}, set TASKER_ACCOUNT_DATA_DIR ({error})".format(
+            path=path, error=error,
+        ))
+
+    stat = os.stat(path)
+    if (hasattr(os, 'getuid') and stat.st_uid != os.getuid()) or stat.st_mode & 0o022:
+        raise ImproperlyConfigured("Directory is not private: {path}".format(path=path))
+    return path
+
+
+def compiled_path(source: str) -> str:
+    """
+    Path of the compiled file for the domain list
+
+    :param source: path of the domain list
+    :returns: path from TASKER_ACCOUNT_EMAIL_BLACKLIST_COMPILED or a file in data_dir()
+    """
+    path = getattr(settings, 'TASKER_ACCOUNT_EMAIL_BLACKLIST_COMPILED', None)
+    if path:
+        return path
+
+    key = hashlib.sha1(os.path.abspath(source).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(data_dir(), 'blacklist_{key}.idx'.format(key=key))
+
+
+def check() -> None:
+    """
+    Checks the domain list and the directory of the compiled file, called from AppConfig.ready
+
+    :raise: ImproperlyConfigured If the domain list is not found or the compiled file can not be written
+    """
+    source = check_source(getattr(settings, 'TASKER_ACCOUNT_EMAIL_BLACKLIST', DEFAULT_PATH))
+    directory = os.path.dirname(os.path.abspath(compiled_path(source)))
+    if not os.access(directory, os.W_OK):
+        raise ImproperlyConfigured("Directory of the compiled blacklist is not writable: {path}".format(path=directory))
+
+
+class Blacklist:
+    """
+    Domain blacklist backed by a memory-mapped sorted file.
+    Pages of the compiled file are shared by all worker processes,
+    the file is compiled again when the domain list changes.
+    """
+
+    def __init__(self, source: str, target: str, interval: float = 10):
+        self.source = source
+        self.target = target
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._data = b''
+        self._header = None
+        self._checked = None
+
+    def __contains__(self, domain: str) -> bool:
+        self.reload()
+
+        labels = domain.lower().rstrip('.').split('.')
+        data = self._data
+
+        # Domain and all parent domains except the top-level domain
+        for index in range(len(labels) - 1):
+            try:
+                key = '.'.join(labels[index:]).encode('idna')
+            except UnicodeError:
+                return False
+
+            if self._search(data, key):
+                return True
+
+        return False
+
+    @staticmethod
+    def _search(data, key: bytes) -> bool:
+        low, high = 0, len(data)
+        while low < high:
+            middle = (low + high) // 2
+            start = data.rfind(b'\n', 0, middle) + 1
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = len(data)
+
+            line = data[start:end]
+            if line == key:
+                return True
+            elif line < key:
+                low = end + 1
+            else:
+                high = start
+
+        return False
+
+    def reload(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self._checked is not None and now - self._checked < self.interval:
+            return
+
+        with self._lock:
+            if not force and self._checked is not None and now - self._checked < self.interval:
+                return
+            self._checked = now
+
+            try:
+                header = signature(self.source)
+            except OSError as error:
+                # The loaded domains stay in use until the list is back
+                logger.error("Email blacklist not readable path:{path}, error:{error}".format(
+                    path=self.source, error=error,
+                ))
+                return
+
+            if not force and header == self._header:
+                return
+
+            try:
+                with open(self.target, 'rb') as stream:
+                    compiled = stream.readline().rstrip(b'\n') == header
+            except FileNotFoundError:
+                compiled = False
+
+            if force or not compiled:
+                count = compile_file(self.source, self.target)
+                logger.info("Email blacklist compiled domains:{count}, path:{path}".format(
+                    count=count, path=self.target,
+                ))
+
+            self._map()
+            self._header = header
+
+    def _map(self) -> None:
+        with open(self.target, 'rb') as stream:
+            if os.fstat(stream.fileno()).st_size:
+                mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                mapped = None
+
+        # The previous map is released by the garbage collector,
+        # lookups in other threads may still read from it
+        self._data = mapped if mapped is not None else b''
+
+
+def get() -> Blacklist:
+    """
+    Returns the process-wide blacklist for TASKER_ACCOUNT_EMAIL_BLACKLIST
+
+    :returns: Blacklist
+    :raise: ImproperlyConfigured If the domain list is not found
+    """
+    source = getattr(settings, 'TASKER_ACCOUNT_EMAIL_BLACKLIST', DEFAULT_PATH)
+    blacklist = _blacklists.get(source)
+    if blacklist is None:
+        with _lock:
+            blacklist = _blacklists.get(source)
+            if blacklist is None:
+                blacklist = Blacklist(
+                    source=check_source(source),
+                    target=compiled_path(source),
+                    interval=getattr(settings, 'TASKER_ACCOUNT_EMAIL_BLACKLIST_INTERVAL', 10),
+                )
+                _blacklists[source] = blacklist
+
+    return blacklist
+
+
+def contains(domain: str) -> bool:
+    """
+    Checks the domain and its parent domains in the blacklist
+
+    :param domain: email domain
+    :returns: True if the domain is blacklisted
+    """
+    return domain in get()
@@ -0,0 +1,68 @@
+from django.conf import settings
+
+# Domains hosting the same mailbox, the address is stored with the main domain
+ALIASES = {
+    'ya.ru': 'yandex.ru',
+    'yandex.by': 'yandex.ru',
+    'yandex.com': 'yandex.ru',
+    'yandex.kz': 'yandex.ru',
+    'yandex.ua': 'yandex.ru',
+}
+
+# Rules of the mail services for the comparison of addresses:
+# domain - main domain, dots - dots in the local part are ignored, plus - the +tag is ignored
+RULES = {
+    'gmail.com': {'dots': True, 'plus': True},
+    'googlemail.com': {'domain': 'gmail.com', 'dots': True, 'plus': True},
+    'yandex.ru': {'plus': True},
+}
+
+
+def aliases() -> dict:
+    return getattr(settings, 'TASKER_ACCOUNT_EMAIL_ALIASES', ALIASES)
+
+
+def rules() -> dict:
+    return getattr(settings, 'TASKER_ACCOUNT_EMAIL_RULES', RULES)
+
+
+def normalize(email: str) -> str:
+    """
+    Normalizes an email for storage: lower case and the main domain of the mail service.
+
+    :param email: email address
+    :returns: email
+    """
+    email = email.lower().strip()
+    if '@' not in email:
+        return email
+
+    user, domain = email.rsplit('@', 1)
+    domain = aliases().get(domain, domain)
+    return '{user}@{domain}'.format(user=user, domain=domain)
+
+
+def canonical(email: str) -> str:
+    """
+    Canonical form of an email, addresses of the same mailbox have the same canonical form.
+
+    :param email: email address
+    :returns: canonical email or an empty string
+    """
+    if not email:
+        return ''
+
+    email = normalize(email)
+    if '@' not in email:
+        return email
+
+    user, domain = email.rsplit('@', 1)
+    rule = rules().get(domain)
+    if rule:
+        if rule.get('plus'):
+            user = user.split('+', 1)[0]
+        if rule.get('dots'):
+            user = user.replace('.', '')
+        domain = rule.get('domain', domain)
+
+    return '{user}@{domain}'.format(user=user, domain=domain)
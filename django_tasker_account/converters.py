@@ -2,76 +2,161 @@ from importlib import import_module
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
+from . import tokens
 
-class ConfirmEmail:
-    regex = '[a-z0-9]+'
+SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
 
-    def __init__(self):
-        self.session = None
-        self.next = '/'
 
-        self.username = None
-        self.last_name = None
-        self.first_name = None
-        self.email = None
-        self.password1 = None
-        self.password2 = None
-        self.module = None
+class Payload:
+    """
+    Immutable data decoded from the URL
+    """
+    __slots__ = ()
+    defaults = {}
 
-    def to_python(self, session_key):
-        session_store = import_module(settings.SESSION_ENGINE).SessionStore
-        session = session_store(session_key=session_key)
+    def __init__(self, **kwargs):
+        for name in self.fields():
+            value = kwargs.get(name)
+            object.__setattr__(self, name, self.defaults.get(name) if value is None else value)
 
-        if session is None:
-            raise ValueError('Session not found')
+    @classmethod
+    def fields(cls) -> list:
+        return [name for klass in cls.__mro__ for name in getattr(klass, '__slots__', ()) if not name.startswith('_')]
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{cls} is immutable".format(cls=type(self).__name__))
+
+    def __repr__(self):
+        return '{cls}({fields})'.format(cls=type(self).__name__, fields=', '.join(
+            '{name}={value!r}'.format(name=name, value=getattr(self, name))
+            for name in self.fields() if 'password' not in name
+        ))
+
+
+class Token(Payload):
+    __slots__ = ('session', 'token', 'module', 'next')
+    defaults = {'next': '/'}
+
+    def consume(self) -> bool:
+        """
+        Single use, deletes the session or marks the signed token as used
+
+        :returns: False if the token has already been used
+        """
+        if self.token:
+            return tokens.consume(self.token)
+
+        self.session.delete()
+        return True
+
+
+class ConfirmEmailPayload(Token):
+    __slots__ = ('username', 'last_name', 'first_name', 'email', 'password', 'password1', 'password2')
+
+
+class ChangePasswordPayload(Token):
+    __slots__ = ('user_id', 'fragment', '_user')
+
+    @property
+    def user(self) -> User:
+        """
+        User loaded on first access
+
+        :raise: Http404 If the user is not found or the signed token is bound to another password
+        """
+        try:
+            return self._user
+        except AttributeError:
+            pass
+
+        user = get_object_or_404(User, id=self.user_id)
+        if self.fragment is not None and tokens.password_fragment(user) != self.fragment:
+            raise Http404('Token is not valid')
 
-        if session.get('module') == 'django_tasker_account.forms':
-            self.username = session.get('username')
-            self.last_name = session.get('last_name')
-            self.first_name = session.get('first_name')
-            self.email = session.get('email')
-            self.password1 = session.get('password1')
-            self.password2 = session.get('password2')
-            self.next = session.get('next')
-            self.session = session
-            self.module = session.get('module')
-            return self
-        else:
+        object.__setattr__(self, '_user', user)
+        return user
+
+
+class OAuthPayload(Payload):
+    __slots__ = (
+        'provider', 'access_token', 'refresh_token', 'id', 'birth_date', 'gender', 'avatar', 'last_name', 'first_name',
+        'email', 'username', 'expires_in', 'next', 'session',
+    )
+    defaults = {'next': '/'}
+
+
+class ConfirmEmail:
+    # Session key or signed token
+    regex = '[a-zA-Z0-9_:.-]+'
+
+    @staticmethod
+    def to_python(session_key):
+        if ':' in session_key:
+            payload = tokens.loads(session_key, salt=tokens.SIGNUP)
+            return ConfirmEmailPayload(
+                username=payload.get('u'),
+                last_name=payload.get('l'),
+                first_name=payload.get('f'),
+                email=payload.get('e'),
+                password=payload.get('p'),
+                next=payload.get('n', '/'),
+                token=session_key,
+                module='django_tasker_account.forms',
+            )
+
+        session = SessionStore(session_key=session_key)
+        data = session.load()
+        if data.get('module') != 'django_tasker_account.forms':
             raise ValueError('Session not found')
 
+        return ConfirmEmailPayload(
+            username=data.get('username'),
+            last_name=data.get('last_name'),
+            first_name=data.get('first_name'),
+            email=data.get('email'),
+            password=data.get('password'),
+            password1=data.get('password1'),
+            password2=data.get('password2'),
+            next=data.get('next'),
+            session=session,
+            module=data.get('module'),
+        )
+
     @staticmethod
     def to_url(value):
         return value
 
 
 class ChangePassword:
-    regex = '[a-z0-9]+'
-
-    def __init__(self):
-        self.user_id = None
-        self.user = None
-        self.session = None
-        self.module = None
-        self.next = '/'
+    # Session key or signed token
+    regex = '[a-zA-Z0-9_:.-]+'
 
-    def to_python(self, session_key):
-        session_store = import_module(settings.SESSION_ENGINE).SessionStore
-        session = session_store(session_key=session_key)
-
-        if session is None:
+    @staticmethod
+    def to_python(session_key):
+        if ':' in session_key:
+            payload = tokens.loads(session_key, salt=tokens.FORGOT_PASSWORD)
+            return ChangePasswordPayload(
+                user_id=payload.get('i'),
+                fragment=payload.get('h'),
+                next=payload.get('n', '/'),
+                token=session_key,
+                module='django_tasker_account.forms',
+            )
+
+        session = SessionStore(session_key=session_key)
+        data = session.load()
+        if data.get('module') != 'django_tasker_account.forms':
             raise ValueError('Session not found')
 
-        if session.get('module') == 'django_tasker_account.forms':
-            self.user_id = session.get('user_id')
-            self.user = get_object_or_404(User, id=session.get('user_id'))
-            self.next = session.get('next')
-            self.session = session
-            self.module = session.get('module')
-            return self
-        else:
-            raise ValueError('Session not found')
+        return ChangePasswordPayload(
+            user_id=data.get('user_id'),
+            next=data.get('next'),
+            session=session,
+            module=data.get('module'),
+        )
 
     @staticmethod
     def to_url(value):
@@ -81,48 +166,30 @@ class ChangePassword:
 class OAuth:
     regex = '[a-z0-9]+'
 
-    def __init__(self):
-        self.provider = None
-        self.access_token = None
-        self.id = None
-        self.birth_date = None
-        self.gender = None
-        self.avatar = None
-        self.last_name = None
-        self.first_name = None
-        self.email = None
-        self.username = None
-        self.expires_in = None
-        self.next = '/'
-        self.session = None
-
-    def to_python(self, session_key):
-        session_store = import_module(settings.SESSION_ENGINE).SessionStore
-        session = session_store(session_key=session_key)
-
-        if session is None:
-            raise ValueError('Session not found')
+    @staticmethod
+    def to_python(session_key):
+        session = SessionStore(session_key=session_key)
+        data = session.load().get('oauth')
 
-        if session.get('oauth') is None:
+        if data is None or data.get('module') != 'django_tasker_account.views':
             raise ValueError('Session not found')
 
-        if session.get('oauth').get('module') == 'django_tasker_account.views':
-            self.provider = session.get('oauth').get('provider')
-            self.access_token = session.get('oauth').get('access_token')
-            self.id = session.get('oauth').get('id')
-            self.birth_date = session.get('oauth').get('birth_date')
-            self.gender = session.get('oauth').get('gender')
-            self.avatar = session.get('oauth').get('avatar')
-            self.last_name = session.get('oauth').get('last_name')
-            self.first_name = session.get('oauth').get('first_name')
-            self.email = session.get('oauth').get('email')
-            self.username = session.get('oauth').get('username')
-            self.expires_in = session.get('oauth').get('expires_in')
-            self.next = session.get('oauth').get('next', '/')
-            self.session = session
-            return self
-        else:
-            raise ValueError('Session not found')
+        return OAuthPayload(
+            provider=data.get('provider'),
+            access_token=data.get('access_token'),
+            refresh_token=data.get('refresh_token'),
+            id=data.get('id'),
+            birth_date=data.get('birth_date'),
+            gender=data.get('gender'),
+            avatar=data.get('avatar'),
+            last_name=data.get('last_name'),
+            first_name=data.get('first_name'),
+            email=data.get('email'),
+            username=data.get('username'),
+            expires_in=data.get('expires_in'),
+            next=data.get('next', '/'),
+            session=session,
+        )
 
     @staticmethod
     def to_url(value):
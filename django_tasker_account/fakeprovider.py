@@ -0,0 +1,184 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# 1x1 transparent png
+AVATAR = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Endpoints of the providers, the authorization code is the login of the user at the provider
+    """
+    protocol_version = 'HTTP/1.1'
+
+    # Keep-alive responses in one segment, delayed ACK would add 40ms to each call
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        params = {key: value[-1] for key, value in parse_qs(url.query).items()}
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            params.update({key: value[-1] for key, value in parse_qs(self.rfile.read(length).decode('utf-8')).items()})
+
+        self.server.count(url.path)
+
+        if url.path == '/avatar.png':
+            return self.reply(AVATAR, content_type='image/png')
+
+        route = self.server.routes.get((method, url.path))
+        if route is None:
+            return self.reply({'error': 'not_found'}, status=404)
+
+        if route == 'token':
+            code = params.get('code') or params.get('refresh_token')
+            if not code:
+                return self.reply({'error': 'invalid_grant'}, status=400)
+            return self.reply({
+                'access_token': 'token-' + code,
+                'refresh_token': code,
+                'expires_in': 3600,
+                'user_id': code,
+            })
+
+        authorization = self.headers.get('Authorization', '')
+        token = params.get('access_token') or authorization.split(' ', 1)[-1]
+        if not token.startswith('token-'):
+            return self.reply({'error': 'invalid_token'}, status=401)
+
+        login = token[len('token-'):]
+        return self.reply(getattr(self, route)(login))
+
+    def google(self, login):
+        return {
+            'id': login,
+            'email': login + '@gmail.com',
+            'verified_email': True,
+            'given_name': 'Given',
+            'family_name': 'Family',
+            'picture': self.server.url + '/avatar.png',
+        }
+
+    def yandex(self, login):
+        return {
+            'id': login,
+            'default_email': login + '@yandex.ru',
+            'first_name': 'Given',
+            'last_name': 'Family',
+            'sex': 'female',
+            'is_avatar_empty': True,
+        }
+
+    def mailru(self, login):
+        return {
+            'email': login + '@mail.ru',
+            'first_name': 'Given',
+            'last_name': 'Family',
+            'birthday': '01.01.1981',
+            'gender': 'f',
+            'image': self.server.url + '/avatar.png',
+        }
+
+    def vk(self, login):
+        return {'response': [{
+            'id': login,
+            'first_name': 'Given',
+            'last_name': 'Family',
+            'screen_name': login,
+            'photo_200': self.server.url + '/avatar.png',
+        }]}
+
+    def facebook(self, login):
+        return {
+            'id': login,
+            'first_name': 'Given',
+            'last_name': 'Family',
+            'picture': {'data': {'url': self.server.url + '/avatar.png'}},
+        }
+
+    def reply(self, data, status=200, content_type='application/json'):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeProvider(ThreadingHTTPServer):
+    """
+    In-process stand-in for the OAuth providers, serves until stop()
+
+        with FakeProvider() as fake:
+            with override_settings(TASKER_ACCOUNT_OAUTH_ENDPOINTS=fake.endpoints()):
+                ...
+    """
+    daemon_threads = True
+
+    routes = {
+        ('POST', '/google/token'): 'token',
+        ('GET', '/google/userinfo'): 'google',
+        ('POST', '/yandex/token'): 'token',
+        ('GET', '/yandex/info'): 'yandex',
+        ('POST', '/mailru/token'): 'token',
+        ('GET', '/mailru/userinfo'): 'mailru',
+        ('POST', '/vk/access_token'): 'token',
+        ('POST', '/vk/users.get'): 'vk',
+        ('POST', '/facebook/access_token'): 'token',
+        ('GET', '/facebook/me'): 'facebook',
+    }
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), Handler)
+        self.url = 'http://{host}:{port}'.format(host=host, port=self.server_address[1])
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def count(self, path: str) -> None:
+        with self._lock:
+            self.calls[path] += 1
+
+    def endpoints(self) -> dict:
+        """
+        Value of TASKER_ACCOUNT_OAUTH_ENDPOINTS pointing the providers to the server
+        """
+        return {
+            'google': {'token_url': self.url + '/google/token', 'userinfo_url': self.url + '/google/userinfo'},
+            'yandex': {'token_url': self.url + '/yandex/token', 'userinfo_url': self.url + '/yandex/info'},
+            'mailru': {'token_url': self.url + '/mailru/token', 'userinfo_url': self.url + '/mailru/userinfo'},
+            'vk': {'token_url': self.url + '/vk/access_token', 'userinfo_url': self.url + '/vk/users.get'},
+            'facebook': {'token_url': self.url + '/facebook/access_token', 'userinfo_url': self.url + '/facebook/me'},
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,51 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class Sha256Field(models.BinaryField):
+    """
+    SHA-256 digest stored as 32 raw bytes, in Python the value is the hex string.
+    """
+    description = _("SHA-256 digest")
+
+    def __init__(self, *args, **kwargs):
+        kwargs['max_length'] = 32
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['max_length']
+        return name, path, args, kwargs
+
+    def db_type(self, connection):
+        # BLOB columns cannot be indexed by MySQL without a prefix length
+        if connection.vendor == 'mysql':
+            return 'binary(32)'
+        return super().db_type(connection)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return bytes(value).hex()
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return bytes(value).hex()
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, memoryview)):
+            return value
+
+        try:
+            value = bytes.fromhex(value)
+        except (TypeError, ValueError):
+            raise ValidationError(_("Enter a valid SHA-256 digest."), code='invalid')
+
+        if len(value) != 32:
+            raise ValidationError(_("Enter a valid SHA-256 digest."), code='invalid')
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
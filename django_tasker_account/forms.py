@@ -1,6 +1,6 @@
+import hashlib
 import logging
 import re
-from email.utils import make_msgid, formataddr
 from importlib import import_module
 
 from django import forms
@@ -8,15 +8,16 @@ from django.conf import settings
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm, PasswordResetForm, PasswordChangeForm, \
     SetPasswordForm
 from django.contrib.auth.models import User
-from django.core.mail import EmailMessage
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
 from django.forms import TextInput, PasswordInput, Select, CheckboxInput
 from django.contrib import auth
 from django.shortcuts import get_object_or_404
-from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
-from . import validators, models
+from . import validators, models, middleware, canonical, tokens, usernames, mail, hashing
 logger = logging.getLogger('tasker_account')
 
 
@@ -59,9 +60,10 @@ class Login(AuthenticationForm):
         username = username.lower().strip()
 
         if re.search(r'@', username):
-            user = User.objects.filter(email=username)
-            if user.count():
-                return user.last().username
+            user = User.objects.filter(profile__email_canonical=canonical.canonical(username))
+            user = user.values_list('username', flat=True).first()
+            if user:
+                return user
 
         return username
 
@@ -70,6 +72,11 @@ class Login(AuthenticationForm):
         password = password.strip()
         return password
 
+    def clean(self):
+        # authenticate() verifies the password in a hashing slot
+        with hashing.slot():
+            return super().clean()
+
     def login(self) -> User:
         """
         User authorization
@@ -98,7 +105,6 @@ class Signup(UserCreationForm):
         ),
         validators=[
             validators.username,
-            validators.username_dublicate,
         ]
     )
 
@@ -133,7 +139,6 @@ class Signup(UserCreationForm):
         validators=[
             validators.email,
             validators.email_blacklist,
-            validators.email_dublicate,
         ]
     )
 
@@ -166,75 +171,122 @@ class Signup(UserCreationForm):
 
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop('request', None)
+        self._uniqueness = {}
         super().__init__(*args, **kwargs)
 
     def clean_username(self):
         return self.cleaned_data.get('username').lower().strip()
 
+    def clean(self):
+        cleaned_data = super().clean()
+        username = cleaned_data.get('username')
+        errors = self.uniqueness(username, cleaned_data.get('email'))
+        for field, error in errors.items():
+            self.add_error(field, error)
+
+        if 'username' in errors:
+            _suggest_username(self, username, cleaned_data.get('first_name'), cleaned_data.get('last_name'))
+        return cleaned_data
+
+    def uniqueness(self, username: str, email: str) -> dict:
+        """
+        Dublicate username and email, checked with one query once per form
+        """
+        key = (username, email)
+        if key not in self._uniqueness:
+            self._uniqueness[key] = validators.uniqueness(username=username, email=email)
+        return self._uniqueness[key]
+
+    def validate_unique(self):
+        # Checked in clean() with the email in the same query
+        pass
+
+    def save(self, commit=True):
+        """
+        Saves the user, the unique constraints are checked by the database.
+        Returns None and adds the errors to the form if the username or the email is dublicate.
+        """
+        # The password is hashed in a slot, outside of the transaction
+        with hashing.slot():
+            user = super().save(commit=False)
+
+        if not commit:
+            return user
+
+        try:
+            with transaction.atomic():
+                user.save()
+                return user
+        except IntegrityError:
+            errors = validators.uniqueness(
+                username=self.cleaned_data.get('username'),
+                email=self.cleaned_data.get('email'),
+            )
+            if not errors:
+                raise
+
+        for field, error in errors.items():
+            self.add_error(field, error)
+        return None
+
     def clean_email(self):
-        email = self.cleaned_data.get('email').lower().strip()
-
-        user = email.rsplit('@', 1)[0]
-        domain = email.rsplit('@', 1)[-1]
-        if domain == 'ya.ru'\
-                or domain == 'yandex.by'\
-                or domain == 'yandex.com'\
-                or domain == 'yandex.kz'\
-                or domain == 'yandex.ua':
-            email = user+'@yandex.ru'
-        return email
+        return canonical.normalize(self.cleaned_data.get('email'))
 
     def clean_password1(self):
         return self.cleaned_data.get('password1').strip()
 
-    def confirmation(self) -> import_module(settings.SESSION_ENGINE).SessionStore:
-        session_store = import_module(settings.SESSION_ENGINE).SessionStore
-        session = session_store()
-        session.set_expiry(getattr(settings, 'TASKER_ACCOUNT_SESSION_SIGNUP', 60*60*24))
-
-        session['username'] = self.cleaned_data.get('username')
-        session['last_name'] = self.cleaned_data.get('last_name')
-        session['first_name'] = self.cleaned_data.get('first_name')
-        session['email'] = self.cleaned_data.get('email')
-        session['password1'] = self.cleaned_data.get('password1')
-        session['password2'] = self.cleaned_data.get('password2')
-        session['module'] = __name__
+    def confirmation(self):
+        """
+        Sends the confirmation email
 
+        :returns: SessionStore, or the signed token if TASKER_ACCOUNT_TOKEN_MODE is signed
+        """
         if hasattr(self.request, 'GET'):
-            session['next'] = self.request.GET.get('next', '/')
+            next_url = self.request.GET.get('next', '/')
         else:
-            session['next'] = '/'
-
-        session.create()
+            next_url = '/'
+
+        # Validated data and the password hashed once, confirmation only inserts the user
+        password = hashing.make_password(self.cleaned_data.get('password1'))
+
+        if tokens.signed():
+            session = None
+            session_key = tokens.dumps({
+                'u': self.cleaned_data.get('username'),
+                'l': self.cleaned_data.get('last_name'),
+                'f': self.cleaned_data.get('first_name'),
+                'e': self.cleaned_data.get('email'),
+                'p': password,
+                'n': next_url,
+            }, salt=tokens.SIGNUP)
+        else:
+            session_store = import_module(settings.SESSION_ENGINE).SessionStore
+            session = session_store()
+            session.set_expiry(getattr(settings, 'TASKER_ACCOUNT_SESSION_SIGNUP', 60*60*24))
+
+            session['username'] = self.cleaned_data.get('username')
+            session['last_name'] = self.cleaned_data.get('last_name')
+            session['first_name'] = self.cleaned_data.get('first_name')
+            session['email'] = self.cleaned_data.get('email')
+            session['password'] = password
+            session['module'] = __name__
+            session['next'] = next_url
+            session.create()
+            session_key = session.session_key
 
         if hasattr(self.request, 'get_host'):
             host = self.request.get_host()
         else:
             host = 'localhost'
 
-        subject = render_to_string('django_tasker_account/email/signup.subject.txt', {}).strip()
-
-        url = reverse('django_tasker_account:confirm_email', kwargs={'data': session.session_key})
-
-        body = render_to_string('django_tasker_account/email/signup.body.html', {
-            'session_key': session.session_key,
-            'host': host,
+        url = reverse('django_tasker_account:confirm_email', kwargs={'data': session_key})
+        mail.send(mail.message('django_tasker_account/email/signup', self.cleaned_data.get('email'), {
+            'session_key': session_key,
             'url': url,
-        })
-
-        name_email = getattr(settings, 'EMAIL_NAME', settings.DEFAULT_FROM_EMAIL)
-        msg = EmailMessage(
-            subject=subject,
-            body=body,
-            from_email=formataddr((name_email, settings.DEFAULT_FROM_EMAIL)),
-            to=[self.cleaned_data.get('email')],
-            headers={'Message-ID': make_msgid(domain=host)},
-        )
-        msg.content_subtype = "html"
-        msg.send()
+        }, host=host))
 
-        logger.debug("Confirmation code: {session}".format(session=session.session_key))
-        return session
+        logger.debug("Confirmation code: {session}".format(session=session_key))
+        return session or session_key
 
     class Meta:
         model = User
@@ -250,74 +302,96 @@ class ForgotPassword(PasswordResetForm):
             }),
         validators=[
             validators.email,
-            validators.email_exists,
         ]
     )
 
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop('request', None)
+        self._user = None
         super().__init__(*args, **kwargs)
 
     def clean_email(self):
-        email = self.cleaned_data.get('email').lower().strip()
-
-        user = email.rsplit('@', 1)[0]
-        domain = email.rsplit('@', 1)[-1]
-        if domain == 'ya.ru'\
-                or domain == 'yandex.by'\
-                or domain == 'yandex.com'\
-                or domain == 'yandex.kz'\
-                or domain == 'yandex.ua':
-            email = user+'@yandex.ru'
+        email = canonical.normalize(self.cleaned_data.get('email'))
 
+        # The user is resolved once, sendmail() reuses it. An unknown email is not an error,
+        # the response must not tell which accounts exist
+        self._user = User.objects.filter(profile__email_canonical=canonical.canonical(email)).first()
         return email
 
-    def sendmail(self) -> import_module(settings.SESSION_ENGINE).SessionStore:
-        session_store = import_module(settings.SESSION_ENGINE).SessionStore
-
-        user = self.user()
-
-        session = session_store()
-        session.set_expiry(getattr(settings, 'TASKER_ACCOUNT_SESSION_FORGOTPASSWORD', 60*60*24))
-        session['user_id'] = user.id
-        session['module'] = __name__
+    def sendmail(self):
+        """
+        Sends the password recovery email, repeated requests for the email within
+        TASKER_ACCOUNT_FORGOT_PASSWORD_WINDOW seconds are coalesced into the first one.
+        An email without an account gets a notice instead, the work of the request is the same.
 
-        if hasattr(self.request, 'GET'):
-            session['next'] = self.request.GET.get('next', '/')
-        else:
-            session['next'] = '/'
+        :returns: SessionStore, or the signed token if TASKER_ACCOUNT_TOKEN_MODE is signed,
+            None if the request is coalesced or the email has no account
+        """
+        email = self.cleaned_data.get('email')
+        digest = hashlib.sha256(canonical.canonical(email).encode('utf-8')).hexdigest()
 
-        session.create()
+        key = 'tasker_account_forgot_password_{digest}'.format(digest=digest)
+        if not cache.add(key, 1, getattr(settings, 'TASKER_ACCOUNT_FORGOT_PASSWORD_WINDOW', 60)):
+            logger.info("Password recovery coalesced email:{digest}".format(digest=digest[:16]))
+            return None
 
         if hasattr(self.request, 'get_host'):
             host = self.request.get_host()
         else:
             host = 'localhost'
 
-        subject = render_to_string('django_tasker_account/email/forgot_password.subject.txt', {}).strip()
-
-        url = reverse('django_tasker_account:change_password', kwargs={'data': session.session_key})
-
-        body = render_to_string('django_tasker_account/email/forgot_password.body.html', {
-            'session_key': session.session_key,
-            'host': host,
-            'url': url,
-        })
-
-        name_email = getattr(settings, 'EMAIL_NAME', settings.DEFAULT_FROM_EMAIL)
-        msg = EmailMessage(
-            subject=subject,
-            body=body,
-            from_email=formataddr((name_email, settings.DEFAULT_FROM_EMAIL)),
-            to=[self.cleaned_data.get('email')],
-            headers={'Message-ID': make_msgid(domain=host)},
-        )
-        msg.content_subtype = "html"
-        msg.send()
-        return session
+        user = self._user
+        if user is None:
+            try:
+                mail.send(mail.message('django_tasker_account/email/forgot_password_unknown', email, {}, host=host))
+            except Exception:
+                cache.delete(key)
+                raise
+            return None
+
+        # The key is released if the email is not sent, the user can retry at once
+        session = None
+        try:
+            if hasattr(self.request, 'GET'):
+                next_url = self.request.GET.get('next', '/')
+            else:
+                next_url = '/'
+
+            if tokens.signed():
+                session_key = tokens.dumps({
+                    'i': user.id,
+                    'h': tokens.password_fragment(user),
+                    'n': next_url,
+                }, salt=tokens.FORGOT_PASSWORD)
+            else:
+                session_store = import_module(settings.SESSION_ENGINE).SessionStore
+                session = session_store()
+                session.set_expiry(getattr(settings, 'TASKER_ACCOUNT_SESSION_FORGOTPASSWORD', 60*60*24))
+                session['user_id'] = user.id
+                session['module'] = __name__
+                session['next'] = next_url
+                session.create()
+                session_key = session.session_key
+
+            url = reverse('django_tasker_account:change_password', kwargs={'data': session_key})
+            mail.send(mail.message('django_tasker_account/email/forgot_password', email, {
+                'session_key': session_key,
+                'url': url,
+            }, host=host))
+        except Exception:
+            cache.delete(key)
+            if session is not None:
+                session.delete()
+            raise
+
+        return session or session_key
 
     def user(self):
-        return get_object_or_404(User, email=self.cleaned_data.get('email'))
+        if self._user is None:
+            self._user = get_object_or_404(
+                User, profile__email_canonical=canonical.canonical(self.cleaned_data.get('email')),
+            )
+        return self._user
 
 
 class ChangePassword(SetPasswordForm):
@@ -347,6 +421,10 @@ class ChangePassword(SetPasswordForm):
         self.request = kwargs.pop('request', None)
         super().__init__(*args, **kwargs)
 
+    def save(self, commit=True):
+        with hashing.slot():
+            return super().save(commit=commit)
+
     def login(self) -> User:
         """
         User authorization
@@ -394,6 +472,14 @@ class ProfileChangePassword(PasswordChangeForm):
         self.request = kwargs.pop('request', None)
         super().__init__(*args, **kwargs)
 
+    def clean_old_password(self):
+        with hashing.slot():
+            return super().clean_old_password()
+
+    def save(self, commit=True):
+        with hashing.slot():
+            return super().save(commit=commit)
+
     def login(self) -> User:
         """
         User authorization
@@ -414,11 +500,21 @@ class OAuth(forms.Form):
         ),
         validators=[
             validators.username,
-            validators.username_dublicate,
         ],
         label=_('username')
     )
 
+    def add_errors(self, error: ValidationError) -> None:
+        """
+        Adds errors of models.create_user to the form
+        """
+        username = self.cleaned_data.get('username')
+        for field, errors in error.error_dict.items():
+            self.add_error(field if field in self.fields else None, errors)
+
+        if 'username' in error.error_dict:
+            _suggest_username(self, username)
+
 
 class Profile(forms.Form):
     GENDER = [
@@ -494,6 +590,7 @@ class Profile(forms.Form):
         profile.birth_date = self.cleaned_data.get('birth_date')
         profile.gender = self.cleaned_data.get('gender')
         profile.save()
+        middleware.invalidate(self.request)
 
         logger.info("User profile update id:{id}, first_name:{first_name}, last_name:{last_name}, language:{language}, "
                     "birth_date:{birth_date}, gender:{gender}".format(
@@ -522,3 +619,9 @@ class MyLocation(forms.Form):
 class Avatar(forms.Form):
     avatar = forms.ImageField()
 
+
+# Suggestion of a free username in the errors
+def _suggest_username(form: forms.Form, username: str, first_name: str = None, last_name: str = None) -> None:
+    suggestion = usernames.suggest(username=username, first_name=first_name, last_name=last_name)
+    if suggestion:
+        form.add_error('username', _("Username %(username)s is available") % {'username': suggestion})
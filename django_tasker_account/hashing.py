@@ -0,0 +1,143 @@
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.translation import gettext_lazy as _
+
+logger = logging.getLogger('tasker_account')
+
+_lock = threading.Lock()
+_semaphore = None
+_waiting = 0
+_stats = {'calls': 0, 'overloaded': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+
+
+class Overloaded(Exception):
+    pass
+
+
+def concurrency() -> int:
+    return getattr(settings, 'TASKER_ACCOUNT_HASHING_CONCURRENCY', None) or os.cpu_count() or 1
+
+
+def queue() -> int:
+    return getattr(settings, 'TASKER_ACCOUNT_HASHING_QUEUE', concurrency() * 4)
+
+
+def timeout() -> float:
+    return getattr(settings, 'TASKER_ACCOUNT_HASHING_TIMEOUT', 5)
+
+
+@contextmanager
+def slot():
+    """
+    Runs the block with at most TASKER_ACCOUNT_HASHING_CONCURRENCY concurrent hashings in the process,
+    the other threads wait in a queue of TASKER_ACCOUNT_HASHING_QUEUE
+
+    :raise: Overloaded If the queue is full or the slot is not free within TASKER_ACCOUNT_HASHING_TIMEOUT seconds
+    """
+    global _semaphore, _waiting
+
+    with _lock:
+        if _semaphore is None:
+            _semaphore = threading.BoundedSemaphore(concurrency())
+        semaphore = _semaphore
+
+    wait = 0.0
+    acquired = semaphore.acquire(blocking=False)
+    if not acquired:
+        with _lock:
+            if _waiting >= queue():
+                _stats['overloaded'] += 1
+                logger.warning("Hashing overloaded waiting:{waiting}".format(waiting=_waiting))
+                raise Overloaded()
+            _waiting += 1
+
+        started = time.monotonic()
+        try:
+            acquired = semaphore.acquire(timeout=timeout())
+        finally:
+            wait = time.monotonic() - started
+            with _lock:
+                _waiting -= 1
+
+    with _lock:
+        _stats['calls'] += 1
+        _stats['wait_total'] += wait
+        _stats['wait_max'] = max(_stats['wait_max'], wait)
+        if not acquired:
+            _stats['overloaded'] += 1
+
+    if not acquired:
+        logger.warning("Hashing timed out wait:{wait:.3f}s".format(wait=wait))
+        raise Overloaded()
+
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def make_password(password: str) -> str:
+    """
+    Hashes the password in a slot
+
+    :param password: raw password
+    :returns: encoded password
+    :raise: Overloaded
+    """
+    with slot():
+        return hashers.make_password(password)
+
+
+def stats() -> dict:
+    """
+    Queue-wait metrics of the process
+
+    :returns: calls, overloaded, waiting, wait_total, wait_avg and wait_max, the times in seconds
+    """
+    with _lock:
+        result = dict(_stats, waiting=_waiting)
+    result['wait_avg'] = result['wait_total'] / result['calls'] if result['calls'] else 0.0
+    return result
+
+
+def reset() -> None:
+    global _semaphore
+    with _lock:
+        _semaphore = None
+        _stats.update(calls=0, overloaded=0, wait_total=0.0, wait_max=0.0)
+
+
+def service_unavailable(view):
+    """
+    Decorator of the views hashing passwords, Overloaded is the response 503 and the stats() of the process are logged
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Overloaded:
+            logger.warning(
+                "Hashing unavailable path:{path}, calls:{calls}, overloaded:{overloaded}, waiting:{waiting}, "
+                "wait_avg:{wait_avg:.3f}s, wait_max:{wait_max:.3f}s".format(path=request.path, **stats())
+            )
+            response = HttpResponse(_("Service temporarily unavailable, try again later"), status=503)
+            response['Retry-After'] = '1'
+            return response
+
+    return wrapper
+
+
+@receiver(setting_changed)
+def _clear(setting=None, **kwargs):
+    if setting == 'TASKER_ACCOUNT_HASHING_CONCURRENCY':
+        reset()
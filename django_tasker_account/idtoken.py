@@ -0,0 +1,119 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+# DER prefix of the SHA-256 DigestInfo, RFC 8017 section 9.2
+SHA256_PREFIX = bytes.fromhex('3031300d060960864801650304020105000420')
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def b64decode(value: str) -> bytes:
+    value = value.encode('ascii') if isinstance(value, str) else value
+    return base64.urlsafe_b64decode(value + b'=' * (-len(value) % 4))
+
+
+def b64int(value: str) -> int:
+    return int.from_bytes(b64decode(value), 'big')
+
+
+def rsa_verify(n: int, e: int, message: bytes, signature: bytes) -> bool:
+    """
+    RSASSA-PKCS1-v1_5 verification with SHA-256 (RS256)
+
+    :param n: modulus of the public key
+    :param e: exponent of the public key
+    :param message: signed data
+    :param signature: signature
+    :returns: True if the signature is valid
+    """
+    size = (n.bit_length() + 7) // 8
+    if len(signature) != size:
+        return False
+
+    value = int.from_bytes(signature, 'big')
+    if value >= n:
+        return False
+
+    encoded = pow(value, e, n).to_bytes(size, 'big')
+    digest = SHA256_PREFIX + hashlib.sha256(message).digest()
+    expected = b'\x00\x01' + b'\xff' * (size - len(digest) - 3) + b'\x00' + digest
+    return hmac.compare_digest(encoded, expected)
+
+
+def header(token: str) -> dict:
+    """
+    Header of the token without verification
+
+    :raise: InvalidToken If the token is malformed
+    """
+    try:
+        return json.loads(b64decode(token.split('.', 1)[0]))
+    except ValueError:
+        raise InvalidToken('Token is malformed')
+
+
+def verify(token: str, keys: dict, audience: str, issuers: tuple, leeway: int = 60) -> dict:
+    """
+    Verifies the signature and the claims of an OpenID Connect id_token
+
+    :param token: id_token
+    :param keys: public keys by kid, {kid: (n, e)}
+    :param audience: client id
+    :param issuers: allowed issuers
+    :param leeway: allowed clock skew in seconds
+    :returns: claims
+    :raise: InvalidToken If the token is not valid
+    """
+    try:
+        signing_input, signature = token.encode('ascii').rsplit(b'.', 1)
+        payload = signing_input.split(b'.', 1)[1]
+        claims = json.loads(b64decode(payload))
+        signature = b64decode(signature)
+    except (ValueError, IndexError, UnicodeError):
+        raise InvalidToken('Token is malformed')
+
+    head = header(token)
+    if head.get('alg') != 'RS256':
+        raise InvalidToken('Algorithm {alg} is not supported'.format(alg=head.get('alg')))
+
+    key = keys.get(head.get('kid'))
+    if key is None:
+        raise InvalidToken('Key {kid} not found'.format(kid=head.get('kid')))
+
+    if not rsa_verify(key[0], key[1], signing_input, signature):
+        raise InvalidToken('Signature is not valid')
+
+    now = time.time()
+    if not isinstance(claims.get('exp'), (int, float)) or claims.get('exp') + leeway < now:
+        raise InvalidToken('Token has expired')
+
+    if isinstance(claims.get('iat'), (int, float)) and claims.get('iat') - leeway > now:
+        raise InvalidToken('Token is issued in the future')
+
+    if claims.get('iss') not in issuers:
+        raise InvalidToken('Issuer {iss} is not allowed'.format(iss=claims.get('iss')))
+
+    aud = claims.get('aud')
+    if audience not in (aud if isinstance(aud, list) else [aud]):
+        raise InvalidToken('Audience is not valid')
+
+    return claims
+
+
+def jwks(data: dict) -> dict:
+    """
+    RSA keys of a JWK set
+
+    :param data: JWK set
+    :returns: {kid: (n, e)}
+    """
+    keys = {}
+    for key in data.get('keys', []):
+        if key.get('kty') == 'RSA' and key.get('use', 'sig') == 'sig':
+            keys[key.get('kid')] = (b64int(key.get('n')), b64int(key.get('e')))
+    return keys
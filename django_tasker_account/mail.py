@@ -0,0 +1,262 @@
+import logging
+import smtplib
+from datetime import timedelta
+from email.utils import make_msgid, formataddr
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.template import Context, TemplateDoesNotExist
+from django.template.loader import get_template
+from django.utils import timezone, translation
+
+from . import models
+
+logger = logging.getLogger('tasker_account')
+
+TEMPLATES = (
+    'django_tasker_account/email/signup',
+    'django_tasker_account/email/forgot_password',
+    'django_tasker_account/email/forgot_password_unknown',
+)
+
+# Compiled templates by name, rendered subjects by name and language
+_templates = {}
+_subjects = {}
+
+
+def outbox() -> bool:
+    """
+    The emails are written to the outbox and sent by the send_outbox worker, TASKER_ACCOUNT_EMAIL_OUTBOX
+    """
+    return getattr(settings, 'TASKER_ACCOUNT_EMAIL_OUTBOX', False)
+
+
+def templates(template: str) -> tuple:
+    """
+    Compiled subject and body templates, looked up through the loaders once
+
+    :param template: name without the extension, e.g. django_tasker_account/email/signup
+    :returns: subject and body, django.template.base.Template
+    """
+    compiled = _templates.get(template)
+    if compiled is None:
+        compiled = (
+            get_template(template + '.subject.txt').template,
+            get_template(template + '.body.html').template,
+        )
+        _templates[template] = compiled
+    return compiled
+
+
+def subject(template: str, language: str = None) -> str:
+    """
+    Rendered subject of the template, the subject has no context and is cached per language
+
+    :param template: name without the extension
+    :param language: language code, the active language by default
+    :returns: subject
+    """
+    language = language or translation.get_language()
+    key = (template, language)
+    value = _subjects.get(key)
+    if value is None:
+        with translation.override(language):
+            compiled = templates(template)[0]
+            value = compiled.render(Context(autoescape=compiled.engine.autoescape)).strip()
+        _subjects[key] = value
+    return value
+
+
+def warm(languages: list = None) -> None:
+    """
+    Compiles the email templates and renders the subjects of the languages, called from AppConfig.ready
+
+    :param languages: language codes, TASKER_ACCOUNT_EMAIL_LANGUAGES by default
+    """
+    languages = languages or getattr(settings, 'TASKER_ACCOUNT_EMAIL_LANGUAGES', [settings.LANGUAGE_CODE])
+    for template in TEMPLATES:
+        try:
+            for language in languages:
+                subject(template, language)
+        except TemplateDoesNotExist:
+            # Rendered on the first email, e.g. the project loaders do not include the app templates
+            logger.warning("Email template not found template:{template}".format(template=template))
+
+
+def message(template: str, to: str, context: dict, host: str = 'localhost', language: str = None) -> EmailMessage:
+    """
+    Renders the email of the template
+
+    :param template: name without the extension, e.g. django_tasker_account/email/signup
+    :param to: email address of the recipient
+    :param context: context of the body
+    :param host: host of the site, domain of the Message-ID
+    :param language: language code, the active language by default
+    :returns: EmailMessage
+    """
+    return render_many(template, [(to, context)], host=host, language=language)[0]
+
+
+def render_many(template: str, recipients, host: str = 'localhost', language: str = None) -> list:
+    """
+    Renders the email of the template for many recipients, the template, the translation and the context
+    are set up once, e.g. for resending the confirmations of the pending signups
+
+    :param template: name without the extension
+    :param recipients: iterable of the email address and the context of the body
+    :param host: host of the site, domain of the Message-ID
+    :param language: language code, the active language by default
+    :returns: list of EmailMessage
+    """
+    language = language or translation.get_language()
+    from_email = formataddr((getattr(settings, 'EMAIL_NAME', settings.DEFAULT_FROM_EMAIL), settings.DEFAULT_FROM_EMAIL))
+
+    messages = []
+    with translation.override(language):
+        title = subject(template, language)
+        body = templates(template)[1]
+        context = Context({'host': host}, autoescape=body.engine.autoescape)
+
+        for to, values in recipients:
+            with context.push(values):
+                msg = EmailMessage(
+                    subject=title,
+                    body=body.render(context),
+                    from_email=from_email,
+                    to=[to],
+                    headers={'Message-ID': make_msgid(domain=host)},
+                )
+            msg.content_subtype = "html"
+            messages.append(msg)
+
+    return messages
+
+
+def send(msg: EmailMessage):
+    """
+    Writes the email to the outbox if TASKER_ACCOUNT_EMAIL_OUTBOX is enabled, otherwise sends it at once
+
+    :param msg: EmailMessage
+    :returns: Outbox, or None if the email is sent
+    """
+    if not outbox():
+        msg.send()
+        return None
+
+    return models.Outbox.objects.create(**_outbox(msg))
+
+
+def send_many(messages: list) -> int:
+    """
+    Writes the emails to the outbox with one insert, or sends them over one connection
+
+    :param messages: list of EmailMessage
+    :returns: number of the emails
+    """
+    if not outbox():
+        return get_connection().send_messages(messages) or 0
+
+    return len(models.Outbox.objects.bulk_create([models.Outbox(**_outbox(msg)) for msg in messages], batch_size=500))
+
+
+def claim(batch_size: int) -> list:
+    """
+    Claims the due emails, a claimed email is hidden from other workers for TASKER_ACCOUNT_EMAIL_LEASE seconds
+
+    :param batch_size: maximum number of emails
+    :returns: list of Outbox
+    """
+    now = timezone.now()
+    lease = getattr(settings, 'TASKER_ACCOUNT_EMAIL_LEASE', 60 * 5)
+
+    with transaction.atomic():
+        rows = list(
+            models.Outbox.objects.select_for_update(skip_locked=True)
+            .filter(status=models.Outbox.PENDING, run_after__lte=now)
+            .order_by('run_after')[:batch_size]
+        )
+        models.Outbox.objects.filter(id__in=[row.id for row in rows]).update(
+            run_after=now + timedelta(seconds=lease),
+        )
+
+    return rows
+
+
+def process(batch_size: int = 100) -> tuple:
+    """
+    Sends one batch of due emails over one connection of EMAIL_BACKEND
+
+    :param batch_size: maximum number of emails
+    :returns: number of the sent, the retried and the failed emails
+    """
+    sent = retried = failed = 0
+    rows = claim(batch_size)
+    if not rows:
+        return sent, retried, failed
+
+    attempts = getattr(settings, 'TASKER_ACCOUNT_EMAIL_ATTEMPTS', 5)
+    connection = get_connection()
+    try:
+        for row in rows:
+            msg = EmailMessage(
+                subject=row.subject,
+                body=row.body,
+                from_email=row.from_email,
+                to=row.to.split(', '),
+                headers={'Message-ID': row.message_id},
+                connection=connection,
+            )
+            msg.content_subtype = row.content_subtype
+
+            try:
+                # No-op while the connection is open, reconnects after an error
+                connection.open()
+                connection.send_messages([msg])
+            except (smtplib.SMTPException, OSError) as error:
+                row.attempts += 1
+                row.error = str(error)[:255]
+                logger.error("Email sending failed outbox:{id}, attempt:{attempt}, error:{error}".format(
+                    id=row.id, attempt=row.attempts, error=error,
+                ))
+
+                # Rejected recipients are not retried
+                if isinstance(error, smtplib.SMTPRecipientsRefused) or row.attempts >= attempts:
+                    row.status = models.Outbox.FAILED
+                    failed += 1
+                else:
+                    row.run_after = timezone.now() + timedelta(seconds=60 * 2 ** row.attempts)
+                    retried += 1
+
+                connection.close()
+                continue
+
+            row.status = models.Outbox.SENT
+            row.sent = timezone.now()
+            row.error = ''
+            sent += 1
+    finally:
+        connection.close()
+        models.Outbox.objects.bulk_update(rows, ['status', 'attempts', 'run_after', 'error', 'sent'])
+
+    return sent, retried, failed
+
+
+def _outbox(msg: EmailMessage) -> dict:
+    return {
+        'from_email': msg.from_email,
+        'to': ', '.join(msg.to),
+        'subject': msg.subject,
+        'body': msg.body,
+        'content_subtype': msg.content_subtype,
+        'message_id': msg.extra_headers.get('Message-ID', make_msgid()),
+    }
+
+
+@receiver(setting_changed)
+def _clear(setting=None, **kwargs):
+    if setting in ('TEMPLATES', 'LANGUAGE_CODE', 'LANGUAGES', 'LOCALE_PATHS'):
+        _templates.clear()
+        _subjects.clear()
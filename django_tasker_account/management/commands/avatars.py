@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from django_tasker_account import avatars
+
+
+class Command(BaseCommand):
+    help = 'Import the avatars of the OAuth sign-ins in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Jobs claimed at once')
+        parser.add_argument('--loop', action='store_true', help='Keep running and wait for new jobs')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = avatars.process(batch_size=options.get('batch_size'))
+            if done or failed or not options.get('loop'):
+                print("Done:{done} failed:{failed}".format(done=done, failed=failed))
+
+            if not options.get('loop'):
+                break
+
+            if not done and not failed:
+                time.sleep(options.get('interval'))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from django_tasker_account import models
+
+
+class Command(BaseCommand):
+    help = 'Delete consumed signed tokens which have expired'
+
+    def handle(self, *args, **options):
+        max_age = max(
+            getattr(settings, 'TASKER_ACCOUNT_SESSION_SIGNUP', 60*60*24),
+            getattr(settings, 'TASKER_ACCOUNT_SESSION_FORGOTPASSWORD', 60*60*24),
+        )
+        count, _ = models.ConsumedToken.objects.filter(
+            created__lt=timezone.now() - timedelta(seconds=max_age),
+        ).delete()
+        print("Deleted:{count}".format(count=count))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from django_tasker_account import blacklist
+
+
+class Command(BaseCommand):
+    help = 'Compile the email blacklist and check domains'
+
+    def add_arguments(self, parser):
+        parser.add_argument('domain', nargs='*', type=str)
+
+    def handle(self, *args, **options):
+        obj = blacklist.get()
+        obj.reload(force=True)
+        print("Compiled:{path}".format(path=obj.target))
+
+        for domain in options.get('domain'):
+            print("{domain}:{result}".format(domain=domain, result='blacklisted' if domain in obj else 'allowed'))
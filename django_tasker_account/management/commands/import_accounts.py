@@ -0,0 +1,242 @@
+import csv
+import hashlib
+import json
+import time
+from datetime import datetime, timezone
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, IntegrityError
+from django.utils.dateparse import parse_datetime
+
+from django_tasker_account import validators, models, canonical
+
+PROVIDERS = {name.lower(): value for value, name in models.Oauth.PROVIDER}
+PROVIDERS.update({'google': 1, 'yandex': 2, 'mailru': 3, 'vk': 4, 'facebook': 5})
+
+
+class Command(BaseCommand):
+    help = 'Import accounts from CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str)
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None, type=str)
+        parser.add_argument('--chunk-size', default=1000, type=int)
+        parser.add_argument('--rejects', default=None, type=str, help='File for rejected rows (JSON Lines)')
+
+    def handle(self, *args, **options):
+        path = options.get('path')
+        fmt = options.get('format') or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        chunk_size = options.get('chunk_size')
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        rejects = open(options.get('rejects'), 'w', encoding='utf-8') if options.get('rejects') else None
+
+        self.seen_usernames = set()
+        self.seen_emails = set()
+        self.processed = self.created = self.rejected = 0
+        self.started = time.monotonic()
+
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                chunk = []
+                for line, row in self.rows(stream, fmt):
+                    self.processed += 1
+                    account = self.validate(line, row, rejects)
+                    if account is None:
+                        continue
+
+                    chunk.append(account)
+                    if len(chunk) >= chunk_size:
+                        self.save(chunk, rejects)
+                        chunk = []
+
+                if chunk:
+                    self.save(chunk, rejects)
+        finally:
+            if rejects:
+                rejects.close()
+
+        self.progress(final=True)
+
+    @staticmethod
+    def rows(stream, fmt):
+        if fmt == 'csv':
+            for line, row in enumerate(csv.DictReader(stream), start=2):
+                yield line, row
+        else:
+            for line, text in enumerate(stream, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    yield line, json.loads(text)
+                except ValueError:
+                    yield line, None
+
+    def validate(self, line, row, rejects):
+        if not isinstance(row, dict):
+            self.reject(line, row, ['Invalid row'], rejects)
+            return None
+
+        errors = []
+        username = email = None
+
+        try:
+            username = validators.username(str(row.get('username') or ''))
+            if username in self.seen_usernames:
+                raise ValidationError('Duplicate username in file')
+        except ValidationError as error:
+            errors.extend(error.messages)
+
+        if row.get('email'):
+            try:
+                email = validators.email(str(row.get('email')))
+                email = validators.email_blacklist(email)
+                if canonical.canonical(email) in self.seen_emails:
+                    raise ValidationError('Duplicate email in file')
+            except ValidationError as error:
+                errors.extend(error.messages)
+
+        oauth = None
+        if row.get('provider') and row.get('oauth_id'):
+            provider = PROVIDERS.get(str(row.get('provider')).lower())
+            if provider is None and str(row.get('provider')).isdigit():
+                provider = int(row.get('provider'))
+            if provider not in PROVIDERS.values():
+                errors.append('Unknown provider')
+
+            expires_in = datetime.now(timezone.utc)
+            if row.get('expires_in'):
+                expires_in = parse_datetime(str(row.get('expires_in')))
+                if expires_in is None:
+                    errors.append('Invalid expires_in')
+
+            oauth = models.Oauth(
+                oauth_id=hashlib.sha256(str(row.get('oauth_id')).encode("utf-8")).hexdigest(),
+                provider=provider,
+                access_token=row.get('access_token') or '',
+                expires_in=expires_in,
+            )
+
+        if errors:
+            self.reject(line, row, errors, rejects)
+            return None
+
+        self.seen_usernames.add(username)
+        if email:
+            self.seen_emails.add(canonical.canonical(email))
+
+        user = User(
+            username=username,
+            email=email or '',
+            first_name=row.get('first_name') or '',
+            last_name=row.get('last_name') or '',
+            password=self.password(row.get('password')),
+        )
+        return line, row, user, oauth
+
+    @staticmethod
+    def password(value):
+        if not value:
+            return make_password(None)
+
+        # Already hashed by a hasher from PASSWORD_HASHERS
+        try:
+            identify_hasher(value)
+            return value
+        except ValueError:
+            return make_password(value)
+
+    def save(self, chunk, rejects):
+        usernames = set(User.objects.filter(
+            username__in=[user.username for line, row, user, oauth in chunk]
+        ).values_list('username', flat=True))
+
+        emails = set(models.Profile.objects.filter(
+            email_canonical__in=[canonical.canonical(user.email) for line, row, user, oauth in chunk if user.email]
+        ).values_list('email_canonical', flat=True))
+
+        accounts = []
+        lines = {}
+        for line, row, user, oauth in chunk:
+            lines[user.username] = (line, row)
+            if user.username in usernames:
+                self.reject(line, row, ['A user with that username already exists.'], rejects)
+            elif user.email and canonical.canonical(user.email) in emails:
+                self.reject(line, row, ['User with this email is already exists.'], rejects)
+            else:
+                accounts.append((user, oauth))
+
+        if not accounts:
+            self.progress()
+            return
+
+        try:
+            with transaction.atomic():
+                self.insert(accounts)
+            self.created += len(accounts)
+        except IntegrityError:
+            # An account conflicting since the checks above, the chunk is saved again account by account
+            for user, oauth in accounts:
+                try:
+                    with transaction.atomic():
+                        self.insert([(user, oauth)])
+                    self.created += 1
+                except IntegrityError as error:
+                    line, row = lines[user.username]
+                    self.reject(line, row, ['Account conflicts with an existing one: {error}'.format(error=error)],
+                                rejects)
+
+        self.progress()
+
+    @staticmethod
+    def insert(accounts):
+        """
+        Saves the users with their profiles and OAuth links, a conflict of any row raises IntegrityError
+
+        :param accounts: list of (user, oauth)
+        """
+        # Keys set by a rolled back attempt
+        for user, oauth in accounts:
+            user.pk = None
+            if oauth is not None:
+                oauth.pk = None
+        User.objects.bulk_create([user for user, oauth in accounts])
+
+        # Primary keys are not returned by bulk_create on every backend
+        pk = dict(User.objects.filter(
+            username__in=[user.username for user, oauth in accounts]
+        ).values_list('username', 'pk'))
+
+        for user, oauth in accounts:
+            user.pk = pk.get(user.username)
+            if oauth is not None:
+                oauth.user_id = user.pk
+
+        models.Profile.objects.bulk_create_for([user for user, oauth in accounts])
+        models.Oauth.objects.bulk_create([oauth for user, oauth in accounts if oauth is not None])
+
+    def reject(self, line, row, errors, rejects):
+        self.rejected += 1
+
+        if isinstance(row, dict):
+            row = {key: value for key, value in row.items() if key != 'password'}
+
+        record = json.dumps({'line': line, 'errors': [str(error) for error in errors], 'row': row}, default=str)
+        if rejects:
+            rejects.write(record + '\n')
+        else:
+            self.stderr.write(record)
+
+    def progress(self, final=False):
+        elapsed = time.monotonic() - self.started
+        self.stdout.write("{state} processed:{processed} created:{created} rejected:{rejected} rate:{rate:.0f}/s".format(
+            state='Done' if final else 'Progress',
+            processed=self.processed,
+            created=self.created,
+            rejected=self.rejected,
+            rate=self.processed / elapsed if elapsed else 0,
+        ))
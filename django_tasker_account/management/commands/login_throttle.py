@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django_tasker_account import throttle
+
+
+class Command(BaseCommand):
+    help = 'Show or clear the login throttling counters of an IP address, a network or a username'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ip', help='IP address, its network is shown as well')
+        parser.add_argument('--network', help='Network, e.g. 192.0.2.0/24')
+        parser.add_argument('--username', help='Username or email')
+        parser.add_argument('--clear', action='store_true', help='Clear the counters')
+
+    def handle(self, *args, **options):
+        values = {}
+        if options.get('ip'):
+            try:
+                values['network'] = throttle.network(options.get('ip'))
+            except ValueError:
+                raise CommandError("Invalid IP address: {ip}".format(ip=options.get('ip')))
+            values['ip'] = options.get('ip')
+
+        if options.get('network'):
+            values['network'] = options.get('network')
+
+        if options.get('username'):
+            values['username'] = options.get('username').lower().strip()
+
+        if not values:
+            raise CommandError('Specify --ip, --network or --username')
+
+        limits = throttle.limits()
+        for scope, value in values.items():
+            if scope not in limits:
+                print("{scope} {value}: disabled".format(scope=scope, value=value))
+                continue
+
+            if options.get('clear'):
+                throttle.clear(scope, value)
+
+            limit, window = limits[scope]
+            print("{scope} {value}: attempts:{attempts:.1f}, limit:{limit}, window:{window}s".format(
+                scope=scope, value=value, attempts=throttle.attempts(scope, value), limit=limit, window=window,
+            ))
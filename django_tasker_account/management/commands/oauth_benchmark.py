@@ -0,0 +1,123 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_databases, setup_test_environment, \
+    teardown_databases, teardown_test_environment
+from django.urls import reverse
+
+from django_tasker_account import oauth
+from django_tasker_account.fakeprovider import FakeProvider
+
+
+class Command(BaseCommand):
+    help = 'Benchmark OAuth sign-ins through the full Django stack against the local fake provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', default='google', choices=sorted(oauth.providers))
+        parser.add_argument('--logins', default=200, type=int, help='Number of sign-ins')
+        parser.add_argument('--users', default=50, type=int, help='Distinct users, the others are returning sign-ins')
+        parser.add_argument('--concurrency', default=10, type=int, help='SQLite serializes the writes, use PostgreSQL')
+
+    def handle(self, *args, **options):
+        if min(options.get('logins'), options.get('users'), options.get('concurrency')) < 1:
+            raise CommandError('--logins, --users and --concurrency must be positive')
+
+        # The benchmark never touches the configured database
+        path = None
+        if connection.vendor == 'sqlite':
+            fd, path = tempfile.mkstemp(prefix='tasker_account_benchmark', suffix='.sqlite3')
+            os.close(fd)
+            settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = path
+
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            with FakeProvider() as fake:
+                provider = oauth.get(options.get('provider'))
+                client_id = 'OAUTH_{name}_CLIENT_ID'.format(name=provider.name.upper())
+                secret_key = 'OAUTH_{name}_SECRET_KEY'.format(name=provider.name.upper())
+                with override_settings(**{
+                    'TASKER_ACCOUNT_OAUTH_ENDPOINTS': fake.endpoints(),
+                    client_id: 'benchmark',
+                    secret_key: 'benchmark',
+                }):
+                    self.run(fake, provider, options)
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+            if path and os.path.exists(path):
+                os.unlink(path)
+
+    def run(self, fake, provider, options):
+        url = reverse('django_tasker_account:oauth_{name}'.format(name=provider.name))
+        logins = ['user{index}'.format(index=index % options.get('users')) for index in range(options.get('logins'))]
+
+        # New users first, so the returning sign-ins find the linked accounts
+        first, returning = logins[:options.get('users')], logins[options.get('users'):]
+
+        started = time.monotonic()
+        results = []
+        with ThreadPoolExecutor(max_workers=options.get('concurrency')) as executor:
+            for batch in (first, returning):
+                results.extend(executor.map(lambda login: self.login(url, login), batch))
+        elapsed = time.monotonic() - started
+
+        failed = len([result for result in results if result is None])
+        results = [result for result in results if result is not None]
+        latencies = sorted(result[0] for result in results)
+        queries = sum(result[1] for result in results)
+        calls = sum(count for path, count in fake.calls.items() if path != '/avatar.png')
+
+        self.stdout.write("Logins:{logins} failed:{failed} concurrency:{concurrency} time:{time:.2f}s "
+                          "rate:{rate:.0f}/s".format(
+            logins=len(logins),
+            failed=failed,
+            concurrency=options.get('concurrency'),
+            time=elapsed,
+            rate=len(logins) / elapsed if elapsed else 0,
+        ))
+
+        if latencies:
+            self.stdout.write("Latency p50:{p50:.1f}ms p95:{p95:.1f}ms p99:{p99:.1f}ms".format(
+                p50=self.percentile(latencies, 50) * 1000,
+                p95=self.percentile(latencies, 95) * 1000,
+                p99=self.percentile(latencies, 99) * 1000,
+            ))
+            self.stdout.write("Queries per login:{queries:.1f}".format(queries=queries / len(results)))
+            self.stdout.write("Outbound calls per login:{calls:.1f}".format(calls=calls / len(results)))
+
+    @staticmethod
+    def login(url, login):
+        """
+        One sign-in: the provider callback, then the completion step for a new user
+
+        :returns: latency and number of queries, None if the sign-in failed
+        """
+        client = Client(raise_request_exception=False)
+        try:
+            with CaptureQueriesContext(connections['default']) as queries:
+                started = time.monotonic()
+                response = client.get(url, {'code': login, 'state': '/'})
+                if response.status_code == 302 and response.url != '/':
+                    response = client.get(response.url)
+                    if response.status_code == 200:
+                        response = client.post(response.wsgi_request.path, {'username': login})
+
+                latency = time.monotonic() - started
+
+            if response.status_code != 302 or '_auth_user_id' not in client.session:
+                return None
+            return latency, len(queries)
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def percentile(values: list, percent: int) -> float:
+        index = max(0, min(len(values) - 1, int(round(percent / 100 * len(values) + 0.5)) - 1))
+        return values[index]
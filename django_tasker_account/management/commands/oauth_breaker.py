@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_tasker_account import oauth
+
+
+class Command(BaseCommand):
+    help = 'Show or reset the circuit breakers of the OAuth providers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('providers', nargs='*', help='Names of the providers, all by default')
+        parser.add_argument('--reset', action='store_true', help='Close the breakers and clear the counters')
+
+    def handle(self, *args, **options):
+        names = options.get('providers') or list(oauth.providers)
+        for name in names:
+            if name not in oauth.providers:
+                raise CommandError("Provider not found: {name}".format(name=name))
+
+        for name in names:
+            breaker = oauth.get(name).breaker
+            if options.get('reset'):
+                breaker.reset()
+
+            state = breaker.state()
+            if state.get('opened'):
+                status = 'open since {time}'.format(time=datetime.fromtimestamp(state.get('opened')).isoformat())
+            else:
+                status = 'closed'
+
+            print("{name}: {status}, calls:{calls}, errors:{errors}".format(
+                name=name, status=status, calls=state.get('calls'), errors=state.get('errors'),
+            ))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from django_tasker_account import models
+
+
+class Command(BaseCommand):
+    help = 'Unlink the OAuth accounts deauthorized by the providers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Deauthorizations applied at once')
+        parser.add_argument('--loop', action='store_true', help='Keep running and wait for new deauthorizations')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            count = self.apply(options.get('batch_size'))
+            if count or not options.get('loop'):
+                print("Done:{count}".format(count=count))
+
+            if not options.get('loop'):
+                break
+
+            if not count:
+                time.sleep(options.get('interval'))
+
+    @staticmethod
+    def apply(batch_size: int) -> int:
+        count = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    models.Deauthorization.objects.select_for_update(skip_locked=True)
+                    .order_by('id')
+                    .values_list('id', 'provider', 'oauth_id')[:batch_size]
+                )
+                if not batch:
+                    return count
+
+                providers = {}
+                for _, provider, oauth_id in batch:
+                    providers.setdefault(provider, set()).add(oauth_id)
+
+                for provider, oauth_ids in providers.items():
+                    models.Oauth.objects.filter(provider=provider, oauth_id__in=oauth_ids).delete()
+
+                models.Deauthorization.objects.filter(id__in=[row[0] for row in batch]).delete()
+                count += len(batch)
@@ -0,0 +1,120 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from django_tasker_account import models, oauth
+
+
+class Command(BaseCommand):
+    help = 'Refresh the OAuth access tokens expiring soon and prune the revoked ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('providers', nargs='*', help='Names of the providers, all by default')
+        parser.add_argument('--window', default=60*60, type=int, help='Refresh tokens expiring within seconds')
+        parser.add_argument('--chunk-size', default=1000, type=int)
+        parser.add_argument('--workers', default=4, type=int, help='Concurrent requests per provider')
+
+    def handle(self, *args, **options):
+        names = options.get('providers') or list(oauth.providers)
+        for name in names:
+            if name not in oauth.providers:
+                raise CommandError("Provider not found: {name}".format(name=name))
+
+        if options.get('chunk_size') < 1 or options.get('workers') < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+
+        self.processed = self.refreshed = self.revoked = self.failed = 0
+        self.started = time.monotonic()
+
+        until = timezone.now() + timedelta(seconds=options.get('window'))
+        for name in names:
+            provider = oauth.get(name)
+            if not provider.refreshable or not provider.client_id():
+                continue
+
+            with ThreadPoolExecutor(max_workers=options.get('workers')) as executor:
+                self.sweep(provider, executor, until, options.get('chunk_size'))
+
+        self.progress(final=True)
+
+    def sweep(self, provider, executor, until, chunk_size):
+        # Keyset pagination on the (provider, expires_in) index. A token living shorter than the window
+        # stays in it after the refresh and is met again ahead of the cursor, the handled ids are skipped.
+        queryset = models.Oauth.objects.filter(provider=provider.id, expires_in__lt=until).exclude(refresh_token='')
+        cursor = None
+        handled = set()
+        while True:
+            chunk = queryset
+            if cursor:
+                chunk = chunk.filter(Q(expires_in__gt=cursor[0]) | Q(expires_in=cursor[0], id__gt=cursor[1]))
+
+            chunk = list(chunk.order_by('expires_in', 'id').only('id', 'refresh_token', 'expires_in')[:chunk_size])
+            if not chunk:
+                return
+
+            cursor = (chunk[-1].expires_in, chunk[-1].id)
+            chunk = [row for row in chunk if row.id not in handled]
+            handled.update(row.id for row in chunk)
+            if not chunk:
+                continue
+
+            if not self.apply(provider, chunk, executor.map(lambda row: self.refresh(provider, row), chunk), until):
+                self.stderr.write("Provider {name} is unavailable, skipped".format(name=provider.name))
+                return
+
+            self.progress()
+
+    @staticmethod
+    def refresh(provider, row):
+        try:
+            return provider.refresh(row.refresh_token)
+        except oauth.Revoked:
+            return False
+        except oauth.Unavailable:
+            return None
+
+    def apply(self, provider, chunk, results, until):
+        now = timezone.now()
+        updated, revoked = [], []
+        for row, result in zip(chunk, results):
+            self.processed += 1
+            if result is False:
+                revoked.append(row.id)
+            elif result is None:
+                self.failed += 1
+            else:
+                row.access_token = result.get('access_token')
+                row.refresh_token = result.get('refresh_token')
+                # Without the lifetime the token is taken as valid until the end of the window,
+                # the next run refreshes it again
+                if result.get('expires_in'):
+                    row.expires_in = now + timedelta(seconds=int(result.get('expires_in')))
+                else:
+                    row.expires_in = until
+                updated.append(row)
+
+        models.Oauth.objects.bulk_update(updated, ['access_token', 'refresh_token', 'expires_in'])
+        models.Oauth.objects.filter(id__in=revoked).delete()
+        self.refreshed += len(updated)
+        self.revoked += len(revoked)
+
+        # The breaker opened during the chunk
+        return not provider.breaker.is_open()
+
+    def progress(self, final=False):
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            "{state} processed:{processed} refreshed:{refreshed} revoked:{revoked} failed:{failed} "
+            "rate:{rate:.0f}/s".format(
+                state='Done' if final else 'Progress',
+                processed=self.processed,
+                refreshed=self.refreshed,
+                revoked=self.revoked,
+                failed=self.failed,
+                rate=self.processed / elapsed if elapsed else 0,
+            )
+        )
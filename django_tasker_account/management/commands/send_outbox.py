@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_tasker_account import mail
+
+
+class Command(BaseCommand):
+    help = 'Send the emails of the outbox in batches over one connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails claimed and sent over one connection')
+        parser.add_argument('--loop', action='store_true', help='Keep running, otherwise exit once drained')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds between polls when idle')
+
+    def handle(self, *args, **options):
+        if options.get('batch_size') < 1:
+            raise CommandError('--batch-size must be positive')
+
+        self.sent = self.retried = self.failed = 0
+        self.started = time.monotonic()
+
+        while True:
+            sent, retried, failed = mail.process(batch_size=options.get('batch_size'))
+            self.sent += sent
+            self.retried += retried
+            self.failed += failed
+
+            if sent or retried or failed:
+                self.progress()
+            elif options.get('loop'):
+                time.sleep(options.get('interval'))
+            else:
+                break
+
+        self.progress(final=True)
+
+    def progress(self, final=False):
+        elapsed = time.monotonic() - self.started
+        self.stdout.write("{state} sent:{sent} retried:{retried} failed:{failed} rate:{rate:.0f}/s".format(
+            state='Done' if final else 'Progress',
+            sent=self.sent,
+            retried=self.retried,
+            failed=self.failed,
+            rate=self.sent / elapsed if elapsed else 0,
+        ))
@@ -1,6 +1,97 @@
+from functools import lru_cache
+
 import pytz
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY as AUTH_SESSION_KEY
 from django.utils import timezone, translation
 
+# Session key holding the resolved language and timezone of the user
+SESSION_KEY = '_tasker_account'
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name: str) -> pytz.BaseTzInfo:
+    """
+    Returns the process-wide timezone object by its name.
+
+    :param name: timezone name, e.g. Europe/Moscow
+    :returns: pytz timezone
+    """
+    return pytz.timezone(name)
+
+
+def resolve(user) -> dict:
+    """
+    Resolves the language and the timezone of the user profile.
+
+    :param user: authenticated user
+    :returns: dict with keys language and timezone
+    """
+    profile = user.profile
+    context = {'language': profile.language or None, 'timezone': None}
+
+    if profile.geobase_id:
+        locality = profile.geobase.get_family().filter(type=4).last()
+        if locality:
+            context['timezone'] = locality.timezone
+
+    return context
+
+
+def invalidate(request) -> None:
+    """
+    Drops the resolved language and timezone from the session,
+    they are resolved again on the next request.
+
+    :param request: request with session
+    """
+    session = getattr(request, 'session', None)
+    if session is not None:
+        session.pop(SESSION_KEY, None)
+
+
+# Change language and timezone
+class Account:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.skip = tuple(
+            prefix for prefix in (getattr(settings, 'STATIC_URL', None), getattr(settings, 'MEDIA_URL', None))
+            if prefix and prefix.startswith('/')
+        )
+
+    def __call__(self, request):
+        context = self.context(request)
+        if context is not None:
+            if context.get('language'):
+                translation.activate(context.get('language'))
+
+            if context.get('timezone'):
+                timezone.activate(get_timezone(context.get('timezone')))
+            else:
+                timezone.deactivate()
+
+        response = self.get_response(request)
+        return response
+
+    def context(self, request):
+        if self.skip and request.path.startswith(self.skip):
+            return None
+
+        # Anonymous, the user is not loaded from the database
+        session = getattr(request, 'session', None)
+        if session is None or AUTH_SESSION_KEY not in session:
+            return None
+
+        context = session.get(SESSION_KEY)
+        if context is None:
+            if not request.user.is_authenticated:
+                return None
+
+            context = resolve(request.user)
+            session[SESSION_KEY] = context
+
+        return context
+
 
 # Change language
 class Language:
@@ -27,7 +118,7 @@ class Timezone:
                 obj = request.user.profile.geobase.get_family()
                 locality = obj.filter(type=4)
                 if locality.exists():
-                    timezone.activate(pytz.timezone(locality.last().timezone))
+                    timezone.activate(get_timezone(locality.last().timezone))
                 else:
                     timezone.deactivate()
 
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_profiles(apps, schema_editor):
+    """Profiles of users created before the application was installed"""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Profile = apps.get_model('django_tasker_account', 'Profile')
+
+    users = User.objects.filter(profile__isnull=True).values_list('pk', flat=True).order_by('pk')
+    chunk = []
+    for pk in users.iterator(chunk_size=1000):
+        chunk.append(Profile(user_id=pk))
+        if len(chunk) == 1000:
+            Profile.objects.bulk_create(chunk, ignore_conflicts=True)
+            chunk = []
+
+    if chunk:
+        Profile.objects.bulk_create(chunk, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_tasker_account', '0002_language'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_profiles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import migrations, models
+
+from django_tasker_account import canonical
+
+
+def fill_email_canonical(apps, schema_editor):
+    """The first account keeps the canonical email if several accounts share a mailbox"""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Profile = apps.get_model('django_tasker_account', 'Profile')
+
+    seen = set()
+    users = User.objects.exclude(email='').values_list('pk', 'email').order_by('pk')
+    for pk, email in users.iterator(chunk_size=1000):
+        email = canonical.canonical(email)
+        if email in seen:
+            continue
+
+        seen.add(email)
+        Profile.objects.filter(user_id=pk).update(email_canonical=email)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_tasker_account', '0003_profile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='email_canonical',
+            field=models.CharField(blank=True, editable=False, max_length=254, null=True, verbose_name='Canonical email'),
+        ),
+        migrations.RunPython(fill_email_canonical, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='profile',
+            name='email_canonical',
+            field=models.CharField(blank=True, editable=False, max_length=254, null=True, unique=True, verbose_name='Canonical email'),
+        ),
+    ]
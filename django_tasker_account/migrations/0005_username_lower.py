@@ -0,0 +1,50 @@
+import logging
+
+from django.conf import settings
+from django.db import migrations
+
+logger = logging.getLogger('tasker_account')
+
+INDEX = 'tasker_account_username_lower'
+
+
+def create_index(apps, schema_editor):
+    """Case-insensitive unique username, if the database supports indexes on expressions"""
+    connection = schema_editor.connection
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    table = schema_editor.quote_name(User._meta.db_table)
+    column = schema_editor.quote_name(User._meta.get_field('username').column)
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT LOWER({column}) FROM {table} GROUP BY LOWER({column}) HAVING COUNT(*) > 1'.format(
+            column=column, table=table,
+        ))
+        if cursor.fetchone():
+            logger.warning("Usernames differing only in case exist, the index {index} is not created".format(
+                index=INDEX,
+            ))
+            return
+
+    schema_editor.execute('CREATE UNIQUE INDEX {index} ON {table} (LOWER({column}))'.format(
+        index=schema_editor.quote_name(INDEX), table=table, column=column,
+    ))
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute('DROP INDEX IF EXISTS {index}'.format(index=schema_editor.quote_name(INDEX)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_tasker_account', '0004_email_canonical'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_tasker_account', '0005_username_lower'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumedToken',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Digest')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created')),
+            ],
+            options={
+                'verbose_name': 'Consumed token',
+                'verbose_name_plural': 'Consumed tokens',
+            },
+        ),
+    ]
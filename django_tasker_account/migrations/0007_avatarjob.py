@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('django_tasker_account', '0006_consumedtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvatarJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=2048, verbose_name='URL')),
+                ('attempts', models.SmallIntegerField(default=0, verbose_name='Attempts')),
+                ('run_after', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Run after')),
+                ('error', models.CharField(blank=True, max_length=255, verbose_name='Error')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Avatar job',
+                'verbose_name_plural': 'Avatar jobs',
+            },
+        ),
+    ]
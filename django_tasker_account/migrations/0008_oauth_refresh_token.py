@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_tasker_account', '0007_avatarjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oauth',
+            name='refresh_token',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Refresh token'),
+        ),
+        migrations.AddIndex(
+            model_name='oauth',
+            index=models.Index(fields=['provider', 'expires_in'], name='tasker_oauth_expires'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_tasker_account', '0008_oauth_refresh_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Deauthorization',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.IntegerField(choices=[(1, 'Google'), (2, 'Yandex'), (3, 'Mail.ru'), (4, 'VK.com'), (5, 'Facebook')], verbose_name='Server')),
+                ('oauth_id', models.CharField(max_length=255, verbose_name='Oauth ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+            ],
+            options={
+                'verbose_name': 'Deauthorization',
+                'verbose_name_plural': 'Deauthorizations',
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+import hashlib
+import re
+
+from django.db import migrations, models
+
+import django_tasker_account.fields
+
+
+def copy_oauth_id(apps, schema_editor):
+    Oauth = apps.get_model('django_tasker_account', 'Oauth')
+
+    # Streams the rows by primary key ranges
+    last = 0
+    while True:
+        chunk = list(Oauth.objects.filter(pk__gt=last).order_by('pk').only('pk', 'oauth_id')[:1000])
+        if not chunk:
+            break
+
+        for row in chunk:
+            value = row.oauth_id.strip().lower()
+            if not re.match(r'^[0-9a-f]{64}$', value):
+                value = hashlib.sha256(row.oauth_id.encode("utf-8")).hexdigest()
+            row.oauth_id_bin = value
+
+        Oauth.objects.bulk_update(chunk, ['oauth_id_bin'])
+        last = chunk[-1].pk
+
+
+def copy_oauth_id_back(apps, schema_editor):
+    Oauth = apps.get_model('django_tasker_account', 'Oauth')
+
+    last = 0
+    while True:
+        chunk = list(Oauth.objects.filter(pk__gt=last).order_by('pk').only('pk', 'oauth_id_bin')[:1000])
+        if not chunk:
+            break
+
+        for row in chunk:
+            row.oauth_id = row.oauth_id_bin
+
+        Oauth.objects.bulk_update(chunk, ['oauth_id'])
+        last = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_tasker_account', '0009_deauthorization'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='oauth',
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='oauth',
+            name='oauth_id',
+            field=models.CharField(max_length=255, null=True, verbose_name='Oauth ID'),
+        ),
+        migrations.AddField(
+            model_name='oauth',
+            name='oauth_id_bin',
+            field=django_tasker_account.fields.Sha256Field(null=True, verbose_name='Oauth ID'),
+        ),
+        migrations.RunPython(copy_oauth_id, copy_oauth_id_back),
+        migrations.RemoveField(
+            model_name='oauth',
+            name='oauth_id',
+        ),
+        migrations.RenameField(
+            model_name='oauth',
+            old_name='oauth_id_bin',
+            new_name='oauth_id',
+        ),
+        migrations.AlterField(
+            model_name='oauth',
+            name='oauth_id',
+            field=django_tasker_account.fields.Sha256Field(verbose_name='Oauth ID'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='oauth',
+            unique_together={('oauth_id', 'provider')},
+        ),
+        migrations.AddIndex(
+            model_name='oauth',
+            index=models.Index(fields=['user', 'provider'], name='tasker_oauth_user'),
+        ),
+    ]
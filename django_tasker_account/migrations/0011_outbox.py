@@ -0,0 +1,38 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_tasker_account', '0010_oauth_id_binary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Outbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_email', models.CharField(max_length=255, verbose_name='From')),
+                ('to', models.CharField(max_length=1024, verbose_name='To')),
+                ('subject', models.CharField(max_length=255, verbose_name='Subject')),
+                ('body', models.TextField(verbose_name='Body')),
+                ('content_subtype', models.CharField(default='html', max_length=16, verbose_name='Content subtype')),
+                ('message_id', models.CharField(max_length=255, verbose_name='Message-ID')),
+                ('status', models.SmallIntegerField(choices=[(0, 'Pending'), (1, 'Sent'), (2, 'Failed')], default=0, verbose_name='Status')),
+                ('attempts', models.SmallIntegerField(default=0, verbose_name='Attempts')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Run after')),
+                ('error', models.CharField(blank=True, max_length=255, verbose_name='Error')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('sent', models.DateTimeField(blank=True, null=True, verbose_name='Sent')),
+            ],
+            options={
+                'verbose_name': 'Outbox',
+                'verbose_name_plural': 'Outbox',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outbox',
+            index=models.Index(fields=['status', 'run_after'], name='tasker_outbox_due'),
+        ),
+    ]
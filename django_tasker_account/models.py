@@ -3,14 +3,37 @@ from os import urandom
 from pathlib import Path
 
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _, get_supported_language_variant
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
 from django_tasker_geobase import models as geobase_models
 
-from . import validators
+from . import validators, middleware, canonical, fields
+
+
+class ProfileManager(models.Manager):
+    def bulk_create_for(self, users, batch_size=None):
+        """
+        Creates profiles for users saved with bulk_create, which does not send post_save.
+        Users which already have a profile are skipped, other conflicts are not ignored.
+
+        :param users: saved users
+        :param batch_size: number of profiles in one query
+        :returns: list of profiles
+        :raise: IntegrityError If the canonical email belongs to another profile, call it in a transaction
+        """
+        users = list(users)
+        existing = set(self.filter(user_id__in=[user.pk for user in users]).values_list('user_id', flat=True))
+        profiles = [
+            self.model(user_id=user.pk, email_canonical=canonical.canonical(user.email) or None)
+            for user in users if user.pk not in existing
+        ]
+        return self.bulk_create(profiles, batch_size=batch_size)
 
 
 class Profile(models.Model):
@@ -61,6 +84,15 @@ class Profile(models.Model):
         verbose_name=_("Geobase")
     )
 
+    email_canonical = models.CharField(
+        max_length=254,
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        verbose_name=_("Canonical email")
+    )
+
     def path(self, filename):
         extension = Path(filename).suffix
         key = urandom(16).hex()
@@ -69,6 +101,8 @@ class Profile(models.Model):
 
     avatar = models.ImageField(upload_to=path, null=True, blank=True)
 
+    objects = ProfileManager()
+
     def __str__(self):
         return 'User profile {user}'.format(user=self.user)
 
@@ -83,28 +117,167 @@ class Oauth(models.Model):
     )
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_("User"))
-    oauth_id = models.CharField(max_length=255, verbose_name=_("Oauth ID"))
+    # SHA-256 of the id at the provider
+    oauth_id = fields.Sha256Field(verbose_name=_("Oauth ID"))
     provider = models.IntegerField(choices=PROVIDER, verbose_name=_("Server"))
 
     access_token = models.CharField(max_length=255, verbose_name=_("Access token"))
+    refresh_token = models.CharField(max_length=255, blank=True, default='', verbose_name=_("Refresh token"))
     expires_in = models.DateTimeField(verbose_name=_("Expires date"))
 
     class Meta:
         unique_together = (('oauth_id', 'provider'),)
+        indexes = [
+            # Scan of the expiring tokens by oauth_tokens
+            models.Index(fields=['provider', 'expires_in'], name='tasker_oauth_expires'),
+            models.Index(fields=['user', 'provider'], name='tasker_oauth_user'),
+        ]
         verbose_name = _("OAuth")
         verbose_name_plural = _("OAuth")
 
     def __str__(self):
         return '%s %s' % (self.provider, self.user)
 
+
+class ConsumedToken(models.Model):
+    digest = models.CharField(max_length=64, primary_key=True, verbose_name=_("Digest"))
+    created = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name=_("Created"))
+
+    class Meta:
+        verbose_name = _("Consumed token")
+        verbose_name_plural = _("Consumed tokens")
+
+    def __str__(self):
+        return self.digest
+
+
+class AvatarJob(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name=_("User"))
+    url = models.URLField(max_length=2048, verbose_name=_("URL"))
+    attempts = models.SmallIntegerField(default=0, verbose_name=_("Attempts"))
+    run_after = models.DateTimeField(default=timezone.now, db_index=True, verbose_name=_("Run after"))
+    error = models.CharField(max_length=255, blank=True, verbose_name=_("Error"))
+
+    class Meta:
+        verbose_name = _("Avatar job")
+        verbose_name_plural = _("Avatar jobs")
+
+    def __str__(self):
+        return 'Avatar {user}'.format(user=self.user)
+
+
+class Deauthorization(models.Model):
+    provider = models.IntegerField(choices=Oauth.PROVIDER, verbose_name=_("Server"))
+    oauth_id = models.CharField(max_length=255, verbose_name=_("Oauth ID"))
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_("Created"))
+
+    class Meta:
+        verbose_name = _("Deauthorization")
+        verbose_name_plural = _("Deauthorizations")
+
+    def __str__(self):
+        return '%s %s' % (self.provider, self.oauth_id)
+
+
+class Outbox(models.Model):
+    PENDING = 0
+    SENT = 1
+    FAILED = 2
+
+    STATUS = (
+        (PENDING, _("Pending")),
+        (SENT, _("Sent")),
+        (FAILED, _("Failed")),
+    )
+
+    from_email = models.CharField(max_length=255, verbose_name=_("From"))
+    to = models.CharField(max_length=1024, verbose_name=_("To"))
+    subject = models.CharField(max_length=255, verbose_name=_("Subject"))
+    body = models.TextField(verbose_name=_("Body"))
+    content_subtype = models.CharField(max_length=16, default='html', verbose_name=_("Content subtype"))
+    message_id = models.CharField(max_length=255, verbose_name=_("Message-ID"))
+    status = models.SmallIntegerField(choices=STATUS, default=PENDING, verbose_name=_("Status"))
+    attempts = models.SmallIntegerField(default=0, verbose_name=_("Attempts"))
+    run_after = models.DateTimeField(default=timezone.now, verbose_name=_("Run after"))
+    error = models.CharField(max_length=255, blank=True, verbose_name=_("Error"))
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_("Created"))
+    sent = models.DateTimeField(null=True, blank=True, verbose_name=_("Sent"))
+
+    class Meta:
+        verbose_name = _("Outbox")
+        verbose_name_plural = _("Outbox")
+        indexes = [
+            # Due messages of the send_outbox worker
+            models.Index(fields=['status', 'run_after'], name='tasker_outbox_due'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.to, self.subject)
+
+
+def create_user(username: str, email: str = None, password: str = None, password_hash: str = None,
+                **extra_fields) -> User:
+    """
+    Creates a user relying on the unique constraints of the username and the canonical email,
+    without checking them before the insert.
+
+    :param username: username
+    :param email: email address
+    :param password: raw password, the password is unusable if None
+    :param password_hash: already hashed password, used instead of password
+    :returns: User
+    :raise: ValidationError If the username or the email is dublicate
+    """
+    user = User(
+        username=User.normalize_username(username),
+        email=User.objects.normalize_email(email),
+        **extra_fields
+    )
+
+    if password_hash:
+        user.password = password_hash
+    else:
+        user.set_password(password)
+
+    try:
+        with transaction.atomic():
+            user.save()
+            return user
+    except IntegrityError:
+        errors = validators.uniqueness(username=username, email=email)
+        if not errors and User.objects.filter(username__iexact=username).exists():
+            errors['username'] = ValidationError(_("A user with that username already exists."))
+        if not errors:
+            raise
+        raise ValidationError(errors)
+
+
 # Signals
+@receiver(pre_save, sender=User)
+def account_email(instance=None, update_fields=None, **kwargs):
+    # The canonical email of another user is rejected before the user row is written
+    if instance.pk is None or (update_fields is not None and 'email' not in update_fields):
+        return
+
+    email = canonical.canonical(instance.email) or None
+    if email and Profile.objects.filter(email_canonical=email).exclude(user_id=instance.pk).exists():
+        raise ValidationError({'email': ValidationError(_("User with this email is already exists."))})
+
+
 @receiver(post_save, sender=User)
-def account_profile(instance=None, created=None, **kwargs):
+def account_profile(instance=None, created=None, update_fields=None, **kwargs):
+    email = canonical.canonical(instance.email) or None
     if created:
-        Profile.objects.create(user=instance)
-    else:
-        profile = Profile.objects.filter(user=instance)
-        if not profile.count():
-            Profile.objects.create(user=instance)
+        Profile.objects.create(user=instance, email_canonical=email)
+    elif update_fields is None or 'email' in update_fields:
+        # Writes only if the email has changed, a conflict missed by account_email is a concurrent update
+        try:
+            with transaction.atomic():
+                Profile.objects.filter(user=instance).exclude(email_canonical=email).update(email_canonical=email)
+        except IntegrityError:
+            raise ValidationError({'email': ValidationError(_("User with this email is already exists."))})
+
 
-    instance.profile.save()
+@receiver(user_logged_in)
+def account_context(request=None, **kwargs):
+    middleware.invalidate(request)
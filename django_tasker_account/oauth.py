@@ -0,0 +1,594 @@
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime
+from http.cookiejar import DefaultCookiePolicy
+from threading import Lock
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+
+from . import canonical, idtoken
+
+logger = logging.getLogger('tasker_account')
+
+providers = {}
+
+
+def register(cls):
+    """
+    Registers the provider class, the instance is shared by all requests of the process
+    """
+    providers[cls.name] = cls()
+    return cls
+
+
+def get(name: str):
+    """
+    Returns the registered provider
+
+    :param name: name of the provider, e.g. google
+    :returns: Provider
+    :raise: KeyError If the provider is not registered
+    """
+    return providers[name]
+
+
+def timeout() -> tuple:
+    """
+    Connect and read timeouts of the outbound calls, TASKER_ACCOUNT_OAUTH_TIMEOUT
+    """
+    return getattr(settings, 'TASKER_ACCOUNT_OAUTH_TIMEOUT', (3.05, 10))
+
+
+class Unavailable(Exception):
+    """
+    The provider did not answer or the circuit breaker is open
+    """
+
+
+class Revoked(Exception):
+    """
+    The refresh token is permanently revoked
+    """
+
+
+class Breaker:
+    """
+    Circuit breaker of the provider, the state is kept in the cache and shared by all workers.
+    The breaker opens when the error rate of the window crosses TASKER_ACCOUNT_OAUTH_BREAKER_THRESHOLD
+    and closes after TASKER_ACCOUNT_OAUTH_BREAKER_COOLDOWN seconds.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    @staticmethod
+    def window() -> int:
+        return getattr(settings, 'TASKER_ACCOUNT_OAUTH_BREAKER_WINDOW', 60)
+
+    def key(self, kind: str, bucket: int = None) -> str:
+        if bucket is None:
+            return 'tasker_account_oauth_{name}_{kind}'.format(name=self.name, kind=kind)
+        return 'tasker_account_oauth_{name}_{kind}_{bucket}'.format(name=self.name, kind=kind, bucket=bucket)
+
+    def bucket(self) -> int:
+        return int(time.time() // self.window())
+
+    def _incr(self, key: str) -> int:
+        cache.add(key, 0, self.window() * 2)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            return 0
+
+    def is_open(self) -> bool:
+        return cache.get(self.key('open')) is not None
+
+    def record(self, success: bool) -> None:
+        bucket = self.bucket()
+        calls = self._incr(self.key('calls', bucket))
+        if success:
+            return
+
+        errors = self._incr(self.key('errors', bucket))
+        minimum = getattr(settings, 'TASKER_ACCOUNT_OAUTH_BREAKER_MIN_CALLS', 10)
+        threshold = getattr(settings, 'TASKER_ACCOUNT_OAUTH_BREAKER_THRESHOLD', 0.5)
+        if calls >= minimum and errors / calls >= threshold:
+            self.open()
+
+    def open(self) -> None:
+        cooldown = getattr(settings, 'TASKER_ACCOUNT_OAUTH_BREAKER_COOLDOWN', 30)
+        cache.set(self.key('open'), time.time(), cooldown)
+
+        # After the cooldown the counting starts over
+        bucket = self.bucket()
+        cache.delete_many([self.key('calls', bucket), self.key('errors', bucket)])
+        logger.error("OAuth breaker open provider:{name}, cooldown:{cooldown}".format(
+            name=self.name, cooldown=cooldown,
+        ))
+
+    def reset(self) -> None:
+        bucket = self.bucket()
+        cache.delete_many([self.key('open'), self.key('calls', bucket), self.key('errors', bucket)])
+
+    def state(self) -> dict:
+        bucket = self.bucket()
+        return {
+            'opened': cache.get(self.key('open')),
+            'calls': cache.get(self.key('calls', bucket), 0),
+            'errors': cache.get(self.key('errors', bucket), 0),
+        }
+
+
+def not_sent(error: requests.ConnectionError) -> bool:
+    """
+    The request did not leave the client, the connection was refused or timed out
+
+    :param error: ConnectionError
+    :returns: bool
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+class Provider:
+    """
+    OAuth provider, subclasses declare the endpoints and map the user info to the profile:
+    id, email, first_name, last_name, birth_date, gender, avatar, username.
+    """
+    name = None
+    id = None
+    disabled = None
+
+    authorize_url = None
+    token_url = None
+    userinfo_url = None
+    scope = None
+    authorize_params = {}
+
+    # The provider issues refresh tokens
+    refreshable = False
+
+    # OpenID Connect, the id_token of the token response is verified locally instead of the userinfo call
+    jwks_url = None
+    issuers = ()
+
+    # Allowed email domains and the error message
+    domains = None
+    domains_error = None
+
+    def __init__(self):
+        self._http = None
+        self._lock = Lock()
+        self.breaker = Breaker(self.name)
+        self._keys = {}
+        self._keys_fetched = 0
+        self._keys_expires = 0
+
+    def client_id(self) -> str:
+        key = 'OAUTH_{name}_CLIENT_ID'.format(name=self.name.upper())
+        return getattr(settings, key, os.environ.get(key))
+
+    def client_secret(self) -> str:
+        key = 'OAUTH_{name}_SECRET_KEY'.format(name=self.name.upper())
+        return getattr(settings, key, os.environ.get(key))
+
+    def endpoint(self, name: str) -> str:
+        """
+        URL of the endpoint, overridden by TASKER_ACCOUNT_OAUTH_ENDPOINTS e.g. {'google': {'token_url': '...'}}
+        """
+        overrides = getattr(settings, 'TASKER_ACCOUNT_OAUTH_ENDPOINTS', {}).get(self.name, {})
+        return overrides.get(name, getattr(self, name))
+
+    @property
+    def http(self) -> requests.Session:
+        """
+        Keep-alive session of the provider with the connection pool TASKER_ACCOUNT_OAUTH_POOL_SIZE
+        """
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    size = getattr(settings, 'TASKER_ACCOUNT_OAUTH_POOL_SIZE', 10)
+                    http = requests.Session()
+
+                    # The session is shared by all users, cookies must not be kept
+                    http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+                    http.mount('https://', adapter)
+                    http.mount('http://', adapter)
+                    self._http = http
+
+        return self._http
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Outbound call with timeouts and retries through the circuit breaker.
+        GET is retried on network errors and 5xx, POST only when the connection was not established
+        and nothing was sent, the authorization code can be used once.
+
+        :raise: Unavailable If the call failed after the retries or the breaker is open
+        """
+        if self.breaker.is_open():
+            raise Unavailable('Breaker is open')
+
+        retries = getattr(settings, 'TASKER_ACCOUNT_OAUTH_RETRIES', 2)
+        backoff = getattr(settings, 'TASKER_ACCOUNT_OAUTH_BACKOFF', 0.2)
+
+        attempt = 0
+        while True:
+            try:
+                response = self.http.request(method, url, timeout=timeout(), **kwargs)
+            except requests.ConnectionError as error:
+                # Aborted or reset after the request was sent are ConnectionError too
+                retry, failure = method == 'GET' or not_sent(error), error
+            except requests.RequestException as error:
+                retry, failure = method == 'GET', error
+            else:
+                if response.status_code < 500:
+                    self.breaker.record(True)
+                    return response
+                retry, failure = method == 'GET', 'status {code}'.format(code=response.status_code)
+
+            if not retry or attempt >= retries:
+                self.breaker.record(False)
+                logger.error("OAuth request failed provider:{name}, url:{url}, error:{error}".format(
+                    name=self.name, url=url, error=failure,
+                ))
+                raise Unavailable(str(failure))
+
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, backoff * 2 ** attempt))
+            attempt += 1
+
+    def authorize(self, redirect_uri: str, state: str) -> str:
+        params = {
+            'client_id': self.client_id(),
+            'redirect_uri': redirect_uri,
+            'response_type': 'code',
+            'state': state,
+        }
+        if self.scope:
+            params['scope'] = self.scope
+        params.update(self.authorize_params)
+
+        return '{url}?{param}'.format(url=self.endpoint('authorize_url'), param=urlencode(params))
+
+    def token(self, code: str, redirect_uri: str) -> dict:
+        response = self.request('POST', self.endpoint('token_url'), data={
+            'grant_type': 'authorization_code',
+            'code': code,
+            'client_id': self.client_id(),
+            'client_secret': self.client_secret(),
+            'redirect_uri': redirect_uri,
+        })
+        return response.json()
+
+    def refresh(self, refresh_token: str) -> dict:
+        """
+        New access token by the refresh token
+
+        :param refresh_token: refresh token
+        :returns: token response, the refresh token is kept if the provider does not rotate it
+        :raise: Revoked If the refresh token is revoked or expired
+        :raise: Unavailable If the provider is unavailable
+        """
+        response = self.request('POST', self.endpoint('token_url'), data={
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token,
+            'client_id': self.client_id(),
+            'client_secret': self.client_secret(),
+        })
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+
+        if response.status_code in (400, 401) and data.get('error') in ('invalid_grant', 'invalid_token'):
+            raise Revoked(data.get('error'))
+
+        if response.status_code != 200 or not data.get('access_token'):
+            raise Unavailable('status {code}'.format(code=response.status_code))
+
+        data.setdefault('refresh_token', refresh_token)
+        return data
+
+    def userinfo(self, token: dict) -> dict:
+        response = self.request(
+            'GET',
+            self.endpoint('userinfo_url'),
+            params={'format': 'json'},
+            headers={'Authorization': 'OAuth ' + token.get('access_token')},
+        )
+        return response.json()
+
+    def keys(self, kid: str = None) -> dict:
+        """
+        Public keys of the JWK set, cached for TASKER_ACCOUNT_OAUTH_JWKS_TTL seconds or the max-age of the response.
+        An unknown kid refreshes the set at most once a minute, the provider rotates the keys.
+
+        :param kid: id of the key required
+        :returns: {kid: (n, e)}
+        """
+        now = time.monotonic()
+        refresh = now >= self._keys_expires
+        if kid is not None and kid not in self._keys and now - self._keys_fetched >= 60:
+            refresh = True
+
+        if refresh:
+            response = self.request('GET', self.endpoint('jwks_url'))
+            ttl = getattr(settings, 'TASKER_ACCOUNT_OAUTH_JWKS_TTL', 60 * 60)
+            match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+            if match:
+                ttl = int(match.group(1))
+
+            self._keys = idtoken.jwks(response.json())
+            self._keys_fetched = now
+            self._keys_expires = now + ttl
+
+        return self._keys
+
+    def identity(self, token: dict) -> dict:
+        """
+        User info from the verified id_token, or from the userinfo endpoint
+
+        :param token: token response
+        :returns: user info
+        """
+        if self.jwks_url and token.get('id_token'):
+            try:
+                kid = idtoken.header(token.get('id_token')).get('kid')
+                claims = idtoken.verify(
+                    token.get('id_token'),
+                    keys=self.keys(kid),
+                    audience=self.client_id(),
+                    issuers=self.issuers,
+                )
+                return self.claims(claims)
+            except idtoken.InvalidToken as error:
+                logger.error("OAuth id_token is not valid provider:{name}, error:{error}".format(
+                    name=self.name, error=error,
+                ))
+
+        return self.userinfo(token)
+
+    def claims(self, claims: dict) -> dict:
+        """
+        Maps the claims of the id_token to the user info
+        """
+        return claims
+
+    def profile(self, token: dict, info: dict) -> dict:
+        raise NotImplementedError
+
+    def check(self, profile: dict):
+        """
+        Checks the email domain
+
+        :returns: error message or None
+        """
+        if self.domains and profile.get('email'):
+            if profile.get('email').rsplit('@', 1)[-1] not in self.domains:
+                return self.domains_error
+        return None
+
+    @staticmethod
+    def username(email: str):
+        """
+        Username from the local part of the email
+        """
+        if not email:
+            return None
+        return email.rsplit('@', 1)[0].replace(".", "_")
+
+
+@register
+class Google(Provider):
+    name = 'google'
+    id = 1
+    disabled = _("Application OAuth Google is disabled")
+    refreshable = True
+
+    authorize_url = 'https://accounts.google.com/o/oauth2/v2/auth'
+    token_url = 'https://www.googleapis.com/oauth2/v4/token'
+    userinfo_url = 'https://www.googleapis.com/oauth2/v1/userinfo'
+    scope = 'openid https://www.googleapis.com/auth/userinfo.email https://www.googleapis.com/auth/userinfo.profile'
+    authorize_params = {'access_type': 'offline'}
+
+    jwks_url = 'https://www.googleapis.com/oauth2/v3/certs'
+    issuers = ('https://accounts.google.com', 'accounts.google.com')
+
+    domains = ('gmail.com',)
+    domains_error = _('Allowed to use for authorization domain gmail.com')
+
+    def claims(self, claims: dict) -> dict:
+        # sub is the same id as in the userinfo, the linked accounts are kept
+        return {
+            'id': claims.get('sub'),
+            'email': claims.get('email'),
+            'verified_email': claims.get('email_verified'),
+            'given_name': claims.get('given_name'),
+            'family_name': claims.get('family_name'),
+            'picture': claims.get('picture'),
+        }
+
+    def profile(self, token: dict, info: dict) -> dict:
+        email = None
+        if info.get('verified_email'):
+            email = info.get('email').strip().lower()
+
+        return {
+            'id': info.get('id'),
+            'email': email,
+            'first_name': info.get('given_name'),
+            'last_name': info.get('family_name'),
+            'birth_date': None,
+            'gender': None,
+            'avatar': info.get('picture'),
+            'username': self.username(email),
+        }
+
+
+@register
+class Yandex(Provider):
+    name = 'yandex'
+    id = 2
+    disabled = _("Application OAuth Yandex is disabled")
+    refreshable = True
+
+    authorize_url = 'https://oauth.yandex.ru/authorize'
+    token_url = 'https://oauth.yandex.ru/token'
+    userinfo_url = 'https://login.yandex.ru/info'
+
+    domains = ('yandex.ru',)
+    domains_error = _('Allowed to use for authorization domain yandex.ru')
+
+    def authorize(self, redirect_uri: str, state: str) -> str:
+        url = super().authorize(redirect_uri, state)
+        if settings.DEBUG:
+            url += '&' + urlencode({'force_confirm': 'yes'})
+        return url
+
+    def profile(self, token: dict, info: dict) -> dict:
+        avatar = None
+        if not info.get('is_avatar_empty'):
+            avatar = "https://avatars.yandex.net/get-yapic/{avatar_id}/islands-200".format(
+                avatar_id=info.get('default_avatar_id')
+            )
+
+        email = canonical.normalize(info.get('default_email'))
+        return {
+            'id': info.get('id'),
+            'email': email,
+            'first_name': info.get('first_name'),
+            'last_name': info.get('last_name'),
+            'birth_date': info.get('birthday'),
+            'gender': {'male': 1, 'female': 2}.get(info.get('sex')),
+            'avatar': avatar,
+            'username': self.username(email),
+        }
+
+
+@register
+class Mailru(Provider):
+    name = 'mailru'
+    id = 3
+    disabled = _("Application OAuth Mail.ru is disabled")
+    refreshable = True
+
+    authorize_url = 'https://oauth.mail.ru/login'
+    token_url = 'https://oauth.mail.ru/token'
+    userinfo_url = 'https://oauth.mail.ru/userinfo'
+    scope = 'userinfo'
+
+    domains = ('mail.ru', 'bk.ru', 'list.ru', 'inbox.ru')
+    domains_error = _('Allowed to use for authorization domain mail.ru, bk.ru, list.ru, inbox.ru')
+
+    def userinfo(self, token: dict) -> dict:
+        response = self.request(
+            'GET',
+            self.endpoint('userinfo_url'),
+            params={'access_token': token.get('access_token')},
+        )
+        return response.json()
+
+    def profile(self, token: dict, info: dict) -> dict:
+        email = info.get('email').strip().lower()
+
+        birth_date = None
+        if info.get('birthday'):
+            birth_date = datetime.strptime(info.get('birthday'), "%d.%m.%Y").strftime("%Y-%m-%d")
+
+        return {
+            'id': info.get('email'),
+            'email': email,
+            'first_name': info.get('first_name'),
+            'last_name': info.get('last_name'),
+            'birth_date': birth_date,
+            'gender': {'m': 1, 'f': 2}.get(info.get('gender')),
+            'avatar': info.get('image'),
+            'username': self.username(email),
+        }
+
+
+@register
+class Vk(Provider):
+    name = 'vk'
+    id = 4
+    disabled = _("Application OAuth Vk.com is disabled")
+
+    authorize_url = 'https:///oauth.vk.com/authorize'
+    token_url = 'https://oauth.vk.com/access_token'
+    userinfo_url = 'https://api.vk.com/method/users.get'
+
+    def userinfo(self, token: dict) -> dict:
+        response = self.request('POST', self.endpoint('userinfo_url'), data={
+            'user_ids': token.get('user_id'),
+            'fields': 'first_name,last_name,bdate,photo_200,screen_name',
+            'access_token': token.get('access_token'),
+            'v': '5.95',
+        })
+        return response.json().get('response').pop()
+
+    def profile(self, token: dict, info: dict) -> dict:
+        username = None
+        if not re.match(r'^id[0-9]+', info.get('screen_name')):
+            username = info.get('screen_name').replace(".", "_")
+
+        return {
+            'id': token.get('user_id'),
+            'email': None,
+            'first_name': info.get('first_name'),
+            'last_name': info.get('last_name'),
+            'birth_date': info.get('birthday'),
+            'gender': None,
+            'avatar': info.get('photo_200'),
+            'username': username,
+        }
+
+
+@register
+class Facebook(Provider):
+    name = 'facebook'
+    id = 5
+    disabled = _("Application OAuth Facebook is disabled")
+
+    authorize_url = 'https://www.facebook.com/v3.2/dialog/oauth'
+    token_url = 'https://graph.facebook.com/v3.3/oauth/access_token'
+    userinfo_url = 'https://graph.facebook.com/v3.2/me'
+
+    def userinfo(self, token: dict) -> dict:
+        response = self.request(
+            'GET',
+            self.endpoint('userinfo_url'),
+            params={'fields': 'id,first_name,last_name,picture.height(200)'},
+            headers={'Authorization': 'OAuth ' + token.get('access_token')},
+        )
+        return response.json()
+
+    def profile(self, token: dict, info: dict) -> dict:
+        picture = None
+        if info.get('picture') and info.get('picture').get('data'):
+            picture = info.get('picture').get('data').get('url')
+
+        return {
+            'id': info.get('id'),
+            'email': None,
+            'first_name': info.get('first_name'),
+            'last_name': info.get('last_name'),
+            'birth_date': None,
+            'gender': None,
+            'avatar': picture,
+            'username': None,
+        }
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import math
+import time
+from ipaddress import ip_address, ip_network
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIRequest
+
+logger = logging.getLogger('tasker_account')
+
+# Attempts and window in seconds by scope
+LIMITS = {
+    'ip': (20, 60),
+    'network': (100, 60),
+    'username': (10, 60 * 10),
+}
+
+
+def limits() -> dict:
+    """
+    Limits of the scopes, TASKER_ACCOUNT_LOGIN_THROTTLE overrides the defaults, None disables a scope
+
+        TASKER_ACCOUNT_LOGIN_THROTTLE = {'ip': (20, 60), 'network': None}
+    """
+    result = dict(LIMITS, **getattr(settings, 'TASKER_ACCOUNT_LOGIN_THROTTLE', {}))
+    return {scope: value for scope, value in result.items() if value}
+
+
+def client_ip(request: WSGIRequest) -> str:
+    """
+    IP address of the client. REMOTE_ADDR is used unless TASKER_ACCOUNT_THROTTLE_PROXIES trusted proxies
+    append to X-Forwarded-For, then the address added by the outermost trusted proxy is used.
+    The left part of the header is sent by the client and is never trusted.
+
+    :param request: WSGIRequest
+    :returns: IP address or None
+    """
+    ip = request.META.get('REMOTE_ADDR')
+
+    proxies = getattr(settings, 'TASKER_ACCOUNT_THROTTLE_PROXIES', 0)
+    if proxies:
+        forwarded = [value.strip() for value in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        forwarded = [value for value in forwarded if value]
+        if len(forwarded) >= proxies:
+            ip = forwarded[-proxies]
+
+    try:
+        return str(ip_address(ip.strip()))
+    except (AttributeError, ValueError):
+        return None
+
+
+def network(ip: str) -> str:
+    """
+    Network of the address, /24 for IPv4 and /64 for IPv6
+
+    :param ip: IP address
+    :returns: network, e.g. 192.0.2.0/24
+    """
+    address = ip_address(ip)
+    return str(ip_network('{ip}/{prefix}'.format(ip=address, prefix=24 if address.version == 4 else 64), strict=False))
+
+
+def values(request: WSGIRequest, username: str = None) -> dict:
+    """
+    Throttled values of the login attempt by scope
+
+    :param request: WSGIRequest
+    :param username: username or email from the login form
+    :returns: dict
+    """
+    result = {}
+    ip = client_ip(request)
+    if ip:
+        result['ip'] = ip
+        result['network'] = network(ip)
+
+    if username and username.strip():
+        result['username'] = username.lower().strip()
+
+    return result
+
+
+def key(scope: str, value: str, bucket: int) -> str:
+    digest = hashlib.sha256(value.encode('utf-8')).hexdigest()
+    return 'tasker_account_throttle_{scope}_{digest}_{bucket}'.format(scope=scope, digest=digest, bucket=bucket)
+
+
+def attempts(scope: str, value: str, counters: dict = None, now: float = None) -> float:
+    """
+    Sliding window estimate: the attempts of the current fixed window and the overlapping part of the previous one
+
+    :param scope: ip, network or username
+    :param value: throttled value
+    :param counters: values of the cache keys, fetched if None
+    :param now: timestamp
+    :returns: number of the attempts within the window
+    """
+    now = now or time.time()
+    window = limits()[scope][1]
+    bucket = int(now // window)
+
+    current, previous = key(scope, value, bucket), key(scope, value, bucket - 1)
+    if counters is None:
+        counters = cache.get_many([current, previous])
+
+    weight = 1 - (now % window) / window
+    return (counters.get(current) or 0) + (counters.get(previous) or 0) * weight
+
+
+def check(request: WSGIRequest, username: str = None) -> int:
+    """
+    Counts the login attempt unless a scope is over the limit, called before the password is hashed
+
+    :param request: WSGIRequest
+    :param username: username or email from the login form
+    :returns: 0 if the attempt is allowed, otherwise seconds to wait
+    """
+    now = time.time()
+    scopes = limits()
+    throttled = {scope: value for scope, value in values(request, username).items() if scope in scopes}
+
+    # All the counters with one round trip
+    keys = []
+    for scope, value in throttled.items():
+        bucket = int(now // scopes[scope][1])
+        keys += [key(scope, value, bucket), key(scope, value, bucket - 1)]
+    counters = cache.get_many(keys)
+
+    for scope, value in throttled.items():
+        limit, window = scopes[scope]
+        if attempts(scope, value, counters=counters, now=now) >= limit:
+            logger.warning("Login throttled scope:{scope}, value:{value}".format(scope=scope, value=value))
+            return max(1, math.ceil(window - now % window))
+
+    for scope, value in throttled.items():
+        window = scopes[scope][1]
+        counter = key(scope, value, int(now // window))
+        cache.add(counter, 0, window * 2)
+        try:
+            cache.incr(counter)
+        except ValueError:
+            pass
+
+    return 0
+
+
+def clear(scope: str, value: str) -> None:
+    """
+    Clears the counters of the value
+
+    :param scope: ip, network or username
+    :param value: throttled value
+    """
+    window = limits()[scope][1]
+    bucket = int(time.time() // window)
+    cache.delete_many([key(scope, value, bucket), key(scope, value, bucket - 1)])
@@ -0,0 +1,77 @@
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction, IntegrityError
+from django.utils.crypto import salted_hmac
+
+from . import models
+
+SIGNUP = 'django_tasker_account.signup'
+FORGOT_PASSWORD = 'django_tasker_account.forgot_password'
+
+
+def signed() -> bool:
+    """
+    Checks the token mode, TASKER_ACCOUNT_TOKEN_MODE is session (default) or signed
+    """
+    return getattr(settings, 'TASKER_ACCOUNT_TOKEN_MODE', 'session') == 'signed'
+
+
+def max_age(salt: str) -> int:
+    if salt == SIGNUP:
+        return getattr(settings, 'TASKER_ACCOUNT_SESSION_SIGNUP', 60*60*24)
+    return getattr(settings, 'TASKER_ACCOUNT_SESSION_FORGOTPASSWORD', 60*60*24)
+
+
+def dumps(payload: dict, salt: str) -> str:
+    """
+    Signed, timestamped and compressed token, nothing is written to the database
+
+    :param payload: data of the token
+    :param salt: SIGNUP or FORGOT_PASSWORD
+    :returns: token
+    """
+    return signing.dumps(payload, salt=salt, compress=True)
+
+
+def loads(token: str, salt: str) -> dict:
+    """
+    Checks the signature and the age of the token
+
+    :param token: token
+    :param salt: SIGNUP or FORGOT_PASSWORD
+    :returns: data of the token
+    :raise: ValueError If the token is not valid or expired
+    """
+    try:
+        return signing.loads(token, salt=salt, max_age=max_age(salt))
+    except signing.BadSignature:
+        raise ValueError('Token is not valid')
+
+
+def password_fragment(user) -> str:
+    """
+    Fragment bound to the current password, the reset token is invalid after the password is changed
+    """
+    return salted_hmac(FORGOT_PASSWORD, user.password).hexdigest()[:16]
+
+
+def digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def consume(token: str) -> bool:
+    """
+    Marks the token as used
+
+    :param token: token
+    :returns: False if the token has already been used
+    """
+    try:
+        with transaction.atomic():
+            models.ConsumedToken.objects.create(digest=digest(token))
+    except IntegrityError:
+        return False
+
+    return True
@@ -0,0 +1,90 @@
+import random
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.functions import Lower
+
+# Same rule as validators.username
+PATTERN = re.compile(r'^[a-z]+[a-z0-9]+[_-]?[a-z0-9]+$')
+
+
+def clean(value: str) -> str:
+    """
+    Username from any text: lower case English letters and numbers with one separator
+
+    :param value: text, e.g. the local part of an email
+    :returns: username or an empty string
+    """
+    if not value:
+        return ''
+
+    parts = [part for part in re.split(r'[^a-z0-9]+', value.lower()) if part]
+    if not parts:
+        return ''
+
+    # One separator is allowed, the rest of the parts are joined
+    username = parts[0] if len(parts) == 1 else parts[0] + '_' + ''.join(parts[1:])
+    username = username.lstrip('0123456789_')[:150]
+    return username if PATTERN.match(username) else ''
+
+
+def candidates(username: str = None, first_name: str = None, last_name: str = None, limit: int = None) -> list:
+    """
+    Ranked candidate usernames
+
+    :param username: desired username
+    :param first_name: first name
+    :param last_name: last name
+    :param limit: number of candidates, TASKER_ACCOUNT_USERNAME_SUGGESTIONS
+    :returns: list of valid usernames
+    """
+    limit = limit or getattr(settings, 'TASKER_ACCOUNT_USERNAME_SUGGESTIONS', 10)
+    first, last = clean(first_name), clean(last_name)
+
+    bases = [clean(username), clean(username).replace('_', '').replace('-', '')]
+    if first and last:
+        bases += [clean(first + '_' + last), clean(first + last), clean(last + '_' + first)]
+    bases = [base for base in bases if base]
+
+    result = []
+    for value in bases + [base + str(number) for base in bases[:1] for number in range(1, 10)]:
+        if PATTERN.match(value) and value not in result:
+            result.append(value)
+
+    # The last candidates have random suffixes, one of them is likely free
+    random_count = min(3, limit) if bases else 0
+    result = result[:limit - random_count]
+    while len(result) < limit and random_count:
+        value = '{base}{number}'.format(base=bases[0], number=random.randint(10, 9999))
+        if value not in result:
+            result.append(value)
+            random_count -= 1
+
+    return result
+
+
+def suggest(username: str = None, first_name: str = None, last_name: str = None) -> str:
+    """
+    The first free candidate, all candidates are checked with one query
+
+    :param username: desired username
+    :param first_name: first name
+    :param last_name: last name
+    :returns: username or None
+    """
+    values = candidates(username=username, first_name=first_name, last_name=last_name)
+    if not values:
+        return None
+
+    taken = set(
+        User.objects.annotate(username_lower=Lower('username'))
+        .filter(username_lower__in=values)
+        .values_list('username_lower', flat=True)
+    )
+
+    for value in values:
+        if value not in taken:
+            return value
+
+    return None
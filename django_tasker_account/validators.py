@@ -8,6 +8,9 @@ from email_validator import validate_email, EmailNotValidError
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
+from django.db.models import Q
+
+from . import blacklist, canonical
 
 
 def mobile_number(number: int) -> str:
@@ -76,16 +79,7 @@ def email(email: str) -> str:
     :returns: email
     :raise: ValidationError If the incorrect email address
     """
-    email = email.lower().strip()
-
-    user = email.rsplit('@', 1)[0]
-    domain = email.rsplit('@', 1)[-1]
-    if domain == 'ya.ru'\
-            or domain == 'yandex.by'\
-            or domain == 'yandex.com'\
-            or domain == 'yandex.kz'\
-            or domain == 'yandex.ua':
-        email = user+'@yandex.ru'
+    email = canonical.normalize(email)
 
     try:
         validate_email(email)
@@ -103,18 +97,9 @@ def email_dublicate(email: str) -> str:
     :returns: email
     :raise: ValidationError If the email address is dublicate
     """
-    email = email.lower().strip()
+    email = canonical.normalize(email)
 
-    user = email.rsplit('@', 1)[0]
-    domain = email.rsplit('@', 1)[-1]
-    if domain == 'ya.ru'\
-            or domain == 'yandex.by'\
-            or domain == 'yandex.com'\
-            or domain == 'yandex.kz'\
-            or domain == 'yandex.ua':
-        email = user+'@yandex.ru'
-
-    if User.objects.filter(email=email).exists():
+    if User.objects.filter(profile__email_canonical=canonical.canonical(email)).exists():
         raise ValidationError(_("User with this email is already exists."))
 
     return email
@@ -128,23 +113,45 @@ def email_exists(email: str) -> str:
     :returns: email
     :raise: ValidationError If the email address is not exists
     """
-    email = email.lower().strip()
+    email = canonical.normalize(email)
 
-    user = email.rsplit('@', 1)[0]
-    domain = email.rsplit('@', 1)[-1]
-    if domain == 'ya.ru'\
-            or domain == 'yandex.by'\
-            or domain == 'yandex.com'\
-            or domain == 'yandex.kz'\
-            or domain == 'yandex.ua':
-        email = user+'@yandex.ru'
-
-    if not User.objects.filter(email=email).exists():
+    if not User.objects.filter(profile__email_canonical=canonical.canonical(email)).exists():
         raise ValidationError(_("User with this email is not exists"))
 
     return email
 
 
+def uniqueness(username: str = None, email: str = None) -> dict:
+    """
+    Checks the dublicate an username and an email with one query
+
+    :param username: User name сhecked.
+    :param email: email address
+    :returns: dict with ValidationError for the fields username and email which are dublicate
+    """
+    username = username.lower().strip() if username else None
+    email = canonical.canonical(email) if email else None
+
+    query = Q()
+    if username:
+        query |= Q(username=username)
+    if email:
+        query |= Q(profile__email_canonical=email)
+
+    errors = {}
+    if not query:
+        return errors
+
+    for dublicate_username, dublicate_email in User.objects.filter(query).values_list(
+            'username', 'profile__email_canonical')[:2]:
+        if username and dublicate_username == username:
+            errors['username'] = ValidationError(_("A user with that username already exists."))
+        if email and dublicate_email == email:
+            errors['email'] = ValidationError(_("User with this email is already exists."))
+
+    return errors
+
+
 def email_blacklist(email: str) -> str:
     """
     Checks the blacklist db an email
@@ -155,60 +162,7 @@ def email_blacklist(email: str) -> str:
     """
     email = email.lower().strip()
     domain = email.rsplit('@', 1)[-1]
-    if domain == 'for4mail.com'\
-            or domain == '2mailnext.com'\
-            or domain == 'prmail.top'\
-            or domain == 'youmails.online'\
-            or domain == 'reddcoin2.com'\
-            or domain == 'proto2mail.com'\
-            or domain == 'mail-2-you.com'\
-            or domain == 'for4mail.com'\
-            or domain == '2mailnext.top'\
-            or domain == 'jo-mail.com'\
-            or domain == 'mailapps.online'\
-            or domain == 'plutocow.com'\
-            or domain == 'ezehe.com'\
-            or domain == 'sharklasers.com'\
-            or domain == 'guerrillamail.info'\
-            or domain == 'grr.la'\
-            or domain == 'guerrillamail.biz'\
-            or domain == 'guerrillamail.com'\
-            or domain == 'guerrillamail.de'\
-            or domain == 'guerrillamail.net'\
-            or domain == 'guerrillamail.org'\
-            or domain == 'guerrillamailblock.com'\
-            or domain == 'pokemail.net'\
-            or domain == 'spam4.me'\
-            or domain == 'fosil.pro'\
-            or domain == 'socrazy.club'\
-            or domain == 'getamailbox.org'\
-            or domain == 'ourawesome.life' \
-            or domain == 'mailboxonline.org' \
-            or domain == 'careless-whisper.com' \
-            or domain == 'ourawesome.life' \
-            or domain == 'ourawesome.online' \
-            or domain == 'secure-box.info' \
-            or domain == 'secure-box.online' \
-            or domain == 'socrazy.club' \
-            or domain == 'socrazy.online' \
-            or domain == 'yevme.com' \
-            or domain == 'trashmail.com' \
-            or domain == '0box.eu' \
-            or domain == 'contbay.com' \
-            or domain == 'damnthespam.com' \
-            or domain == 'kurzepost.de' \
-            or domain == 'objectmail.com' \
-            or domain == 'proxymail.eu' \
-            or domain == 'rcpt.at' \
-            or domain == 'trash-mail.at' \
-            or domain == 'trashmail.at' \
-            or domain == 'trashmail.com' \
-            or domain == 'trashmail.io' \
-            or domain == 'trashmail.me' \
-            or domain == 'trashmail.net' \
-            or domain == 'wegwerfmail.de' \
-            or domain == 'wegwerfmail.net' \
-            or domain == 'wegwerfmail.org':
+    if blacklist.contains(domain):
         raise ValidationError(_("Email address cannot be registered!"))
     return email
 
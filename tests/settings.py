@@ -48,9 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django_tasker_account.middleware.Language',
-    'django_tasker_account.middleware.Timezone',
-
+    'django_tasker_account.middleware.Account',
 ]
 
 ROOT_URLCONF = 'tests.urls'
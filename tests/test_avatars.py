@@ -0,0 +1,122 @@
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+import requests
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from django_tasker_account import avatars, models
+
+# 1x1 transparent png
+PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/avatar.png':
+            body, content_type = PNG, 'image/png'
+        elif self.path == '/big.png':
+            body, content_type = PNG * 1000, 'image/png'
+        else:
+            body, content_type = b'<html></html>', 'text/html; charset=utf-8'
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(
+    ALLOWED_HOSTS=['localhost'],
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    TASKER_ACCOUNT_AVATAR_MAX_SIZE=10000,
+)
+class Avatars(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:{port}'.format(port=cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_process(self):
+        user = User.objects.create_user(username='username')
+        avatars.enqueue(user=user, url=self.url + '/page')
+        avatars.enqueue(user=user, url=self.url + '/avatar.png')
+        self.assertEqual(models.AvatarJob.objects.filter(user=user).count(), 1)
+
+        call_command('avatars', stdout=StringIO())
+        self.assertFalse(models.AvatarJob.objects.exists())
+
+        user.profile.refresh_from_db()
+        self.assertTrue(user.profile.avatar.name.endswith('.png'))
+        with user.profile.avatar.open('rb') as stream:
+            self.assertEqual(stream.read(), PNG)
+
+    def test_rejected(self):
+        for username, path in (('html', '/page'), ('big', '/big.png')):
+            user = User.objects.create_user(username=username)
+            avatars.enqueue(user=user, url=self.url + path)
+
+        self.assertEqual(avatars.process(), (0, 2))
+        self.assertFalse(models.AvatarJob.objects.exists())
+        self.assertFalse(models.Profile.objects.exclude(avatar='').exclude(avatar=None).exists())
+
+    def test_retry(self):
+        user = User.objects.create_user(username='username')
+        job = avatars.enqueue(user=user, url='http://127.0.0.1:1/avatar.png')
+
+        self.assertEqual(avatars.process(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=60))
+
+        # Not due yet
+        self.assertEqual(avatars.process(), (0, 0))
+
+    def test_replaced(self):
+        user = User.objects.create_user(username='username')
+        avatars.enqueue(user=user, url=self.url + '/avatar.png')
+        job, = avatars.claim(10)
+
+        # A later login schedules the avatar again while the job runs
+        avatars.enqueue(user=user, url=self.url + '/avatar.png')
+        self.assertTrue(avatars.run(job, requests.Session()))
+        self.assertTrue(models.AvatarJob.objects.filter(user=user).exists())
+
+        user.profile.refresh_from_db()
+        self.assertFalse(user.profile.avatar)
+
+        # The newer job imports the avatar
+        self.assertEqual(avatars.process(), (1, 0))
+        self.assertFalse(models.AvatarJob.objects.exists())
+        user.profile.refresh_from_db()
+        self.assertTrue(user.profile.avatar.name.endswith('.png'))
+
+    def test_no_profile(self):
+        user = User.objects.create_user(username='username')
+        avatars.enqueue(user=user, url=self.url + '/avatar.png')
+        models.Profile.objects.filter(user=user).delete()
+
+        with self.assertLogs('tasker_account', level='ERROR'):
+            self.assertEqual(avatars.process(), (0, 1))
+        self.assertFalse(models.AvatarJob.objects.exists())
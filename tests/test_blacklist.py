@@ -0,0 +1,92 @@
+import os
+import stat
+import tempfile
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from django_tasker_account import blacklist
+
+
+class Blacklist(SimpleTestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, 'domains.txt')
+        self.write(['# comment', 'Example.com', 'mailinator.com', 'trashmail.com', 'trashmail.com', ''])
+        self.blacklist = blacklist.Blacklist(
+            source=self.source,
+            target=os.path.join(self.directory.name, 'domains.idx'),
+            interval=0,
+        )
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write(self, domains):
+        with open(self.source, 'w', encoding='utf-8') as stream:
+            stream.write("\n".join(domains))
+
+    def test_contains(self):
+        self.assertIn('example.com', self.blacklist)
+        self.assertIn('mailinator.com', self.blacklist)
+        self.assertIn('trashmail.com', self.blacklist)
+        self.assertIn('sub.mailinator.com', self.blacklist)
+        self.assertIn('a.b.MAILINATOR.com', self.blacklist)
+
+        self.assertNotIn('com', self.blacklist)
+        self.assertNotIn('gmail.com', self.blacklist)
+        self.assertNotIn('mailinator.org', self.blacklist)
+        self.assertNotIn('xmailinator.com', self.blacklist)
+
+    def test_reload(self):
+        self.assertNotIn('gmail.com', self.blacklist)
+
+        self.write(['gmail.com'])
+        os.utime(self.source, (1, 1))
+        self.assertIn('gmail.com', self.blacklist)
+        self.assertNotIn('example.com', self.blacklist)
+
+        self.write([])
+        os.utime(self.source, (2, 2))
+        self.assertNotIn('gmail.com', self.blacklist)
+
+    def test_default(self):
+        self.assertTrue(blacklist.contains('2mailnext.com'))
+        self.assertTrue(blacklist.contains('wegwerfmail.org'))
+        self.assertFalse(blacklist.contains('example.com'))
+
+    def test_missing(self):
+        self.assertIn('example.com', self.blacklist)
+
+        os.unlink(self.source)
+        with self.assertLogs('tasker_account', level='ERROR'):
+            self.assertIn('example.com', self.blacklist)
+
+        with override_settings(TASKER_ACCOUNT_EMAIL_BLACKLIST=self.source):
+            with self.assertRaises(ImproperlyConfigured):
+                blacklist.get()
+
+    def test_compiled_path(self):
+        directory = os.path.join(self.directory.name, 'data')
+        with override_settings(TASKER_ACCOUNT_DATA_DIR=directory):
+            path = blacklist.compiled_path(self.source)
+            self.assertEqual(os.path.dirname(path), directory)
+            self.assertEqual(stat.S_IMODE(os.stat(directory).st_mode), 0o700)
+
+            blacklist.compile_file(self.source, path)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+            os.chmod(directory, 0o777)
+            with self.assertRaises(ImproperlyConfigured):
+                blacklist.compiled_path(self.source)
+
+        # Not writable data directory fails at startup, not on the first signup
+        with open(os.path.join(self.directory.name, 'file'), 'w'):
+            pass
+        with override_settings(TASKER_ACCOUNT_DATA_DIR=os.path.join(self.directory.name, 'file', 'data')):
+            with self.assertRaises(ImproperlyConfigured):
+                apps.get_app_config('django_tasker_account').ready()
+
+        with override_settings(TASKER_ACCOUNT_DATA_DIR=None):
+            self.assertFalse(blacklist.compiled_path(self.source).startswith(tempfile.gettempdir()))
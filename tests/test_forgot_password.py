@@ -1,5 +1,9 @@
+import smtplib
+
 from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
 from django.core import mail
+from django.http import Http404
 from django.test import TestCase, override_settings, RequestFactory
 
 from django_tasker_account import forms, views, converters
@@ -38,11 +42,16 @@ class ForgotPassword(TestCase, test_base.Request):
         response = views.forgot_password(request)
         self.assertEqual(response.status_code, 200)
 
-        # Not found email
+        # Not found email, the same response and a notice instead of the link
         request = factory.post('/accounts/forgot_password/', {'email': 'notfound@example.com'})
         request = self.generate_request(request)
         response = views.forgot_password(request)
-        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox.pop()
+        self.assertEqual(message.to, ['notfound@example.com'])
+        self.assertNotRegex(message.body, '/accounts/change/password/')
 
         request = factory.post('/accounts/forgot_password/', {'email': 'user@example.com'})
         request = self.generate_request(request)
@@ -82,3 +91,90 @@ class ForgotPassword(TestCase, test_base.Request):
 
         user = User.objects.get(username='username')
         self.assertTrue(user.check_password('NDMLR2OSwQ'))
+
+    @override_settings(TASKER_ACCOUNT_TOKEN_MODE='signed')
+    def test_views_signed(self):
+        factory = RequestFactory(HTTP_HOST='localhost')
+        request = factory.post('/accounts/forgot_password/', {'email': 'user@example.com'})
+        request = self.generate_request(request)
+
+        form = forms.ForgotPassword(data=request.POST, request=request)
+        self.assertTrue(form.is_valid())
+        token = form.sendmail()
+
+        with self.assertNumQueries(0):
+            obj = converters.ChangePassword().to_python(token)
+        self.assertEqual(obj.user.username, 'username')
+
+        with self.assertRaises(AttributeError):
+            obj.user_id = 0
+
+        request = factory.post(
+            'change/password/{token}/'.format(token=token),
+            {'new_password1': 'NDMLR2OSwQ', 'new_password2': 'NDMLR2OSwQ'}
+        )
+        request = self.generate_request(request)
+        response = views.change_password(request, data=obj)
+        self.assertEqual(response.status_code, 302)
+
+        user = User.objects.get(username='username')
+        self.assertTrue(user.check_password('NDMLR2OSwQ'))
+
+        # The token is bound to the previous password
+        with self.assertRaises(Http404):
+            converters.ChangePassword().to_python(token).user
+
+        request = self.generate_request(factory.get('change/password/{token}/'.format(token=token)))
+        with self.assertRaises(Http404):
+            views.change_password(request, data=converters.ChangePassword().to_python(token))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_coalesce(self):
+        request = self.generate_request(RequestFactory(HTTP_HOST='localhost').get('/'))
+
+        # The user is resolved once by the validation and reused
+        form = forms.ForgotPassword(data={'email': 'User@Example.com'}, request=request)
+        with self.assertNumQueries(1):
+            self.assertTrue(form.is_valid())
+            self.assertEqual(form.user().username, 'username')
+
+        self.assertIsNotNone(form.sendmail())
+        self.assertEqual(len(mail.outbox), 1)
+
+        # Repeated request within the window, no session and no email
+        form = forms.ForgotPassword(data={'email': 'user@example.com'}, request=request)
+        self.assertTrue(form.is_valid())
+        with self.assertNumQueries(0):
+            self.assertIsNone(form.sendmail())
+        self.assertEqual(len(mail.outbox), 1)
+
+        # An unknown email is coalesced the same way and creates no session
+        sessions = Session.objects.count()
+        for _ in range(2):
+            form = forms.ForgotPassword(data={'email': 'notfound@example.com'}, request=request)
+            self.assertTrue(form.is_valid())
+            self.assertIsNone(form.sendmail())
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[-1].to, ['notfound@example.com'])
+        self.assertEqual(Session.objects.count(), sessions)
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        EMAIL_BACKEND='tests.test_outbox.Backend',
+    )
+    def test_coalesce_failed(self):
+        User.objects.create_user(username='down', email='user@down.example.com')
+        request = self.generate_request(RequestFactory(HTTP_HOST='localhost').get('/'))
+        sessions = Session.objects.count()
+
+        # SMTP is down, the request is not coalesced and the session is deleted
+        form = forms.ForgotPassword(data={'email': 'user@down.example.com'}, request=request)
+        self.assertTrue(form.is_valid())
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            form.sendmail()
+        self.assertEqual(Session.objects.count(), sessions)
+
+        form = forms.ForgotPassword(data={'email': 'user@down.example.com'}, request=request)
+        self.assertTrue(form.is_valid())
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            form.sendmail()
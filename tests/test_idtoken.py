@@ -0,0 +1,152 @@
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import TestCase, override_settings
+
+from django_tasker_account import idtoken, oauth
+
+
+def prime(bits: int) -> int:
+    while True:
+        candidate = random.getrandbits(bits) | (1 << (bits - 1)) | 1
+        d, s = candidate - 1, 0
+        while d % 2 == 0:
+            d, s = d // 2, s + 1
+
+        for _ in range(20):
+            x = pow(random.randrange(2, candidate - 1), d, candidate)
+            if x in (1, candidate - 1):
+                continue
+            for _ in range(s - 1):
+                x = pow(x, 2, candidate)
+                if x == candidate - 1:
+                    break
+            else:
+                break
+        else:
+            return candidate
+
+
+def inverse(a: int, m: int) -> int:
+    x0, x1, r0, r1 = 0, 1, m, a
+    while r1:
+        q = r0 // r1
+        x0, x1, r0, r1 = x1, x0 - q * x1, r1, r0 - q * r1
+    return x0 % m if r0 == 1 else None
+
+
+def generate(bits: int = 1024) -> tuple:
+    e = 65537
+    while True:
+        p, q = prime(bits // 2), prime(bits // 2)
+        d = inverse(e, (p - 1) * (q - 1))
+        if p != q and d:
+            return p * q, e, d
+
+
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64int(value: int) -> str:
+    return b64encode(value.to_bytes((value.bit_length() + 7) // 8, 'big'))
+
+
+def sign(key: tuple, kid: str, claims: dict) -> str:
+    n, e, d = key
+    segments = [
+        b64encode(json.dumps({'alg': 'RS256', 'kid': kid, 'typ': 'JWT'}).encode('utf-8')),
+        b64encode(json.dumps(claims).encode('utf-8')),
+    ]
+    size = (n.bit_length() + 7) // 8
+    digest = idtoken.SHA256_PREFIX + hashlib.sha256('.'.join(segments).encode('ascii')).digest()
+    encoded = b'\x00\x01' + b'\xff' * (size - len(digest) - 3) + b'\x00' + digest
+    signature = pow(int.from_bytes(encoded, 'big'), d, n).to_bytes(size, 'big')
+    return '.'.join(segments + [b64encode(signature)])
+
+
+KEY = generate()
+
+
+class Google(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = json.dumps({'keys': [
+            {'kty': 'RSA', 'use': 'sig', 'alg': 'RS256', 'kid': 'key1', 'n': b64int(KEY[0]), 'e': b64int(KEY[1])},
+        ]}).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Cache-Control', 'public, max-age=600')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class IdToken(TestCase):
+    def claims(self, **kwargs):
+        claims = {
+            'iss': 'https://accounts.google.com',
+            'aud': 'client',
+            'sub': '1234567890',
+            'email': 'kazerogova@gmail.com',
+            'email_verified': True,
+            'given_name': 'Лилу',
+            'family_name': 'Казерогова',
+            'iat': int(time.time()),
+            'exp': int(time.time()) + 3600,
+        }
+        claims.update(kwargs)
+        return claims
+
+    def test_verify(self):
+        keys = {'key1': KEY[:2]}
+        issuers = ('https://accounts.google.com',)
+
+        claims = idtoken.verify(sign(KEY, 'key1', self.claims()), keys=keys, audience='client', issuers=issuers)
+        self.assertEqual(claims.get('sub'), '1234567890')
+
+        invalid = (
+            sign(KEY, 'key1', self.claims(exp=int(time.time()) - 3600)),
+            sign(KEY, 'key1', self.claims(aud='other')),
+            sign(KEY, 'key1', self.claims(iss='https://evil.example.com')),
+            sign(KEY, 'key2', self.claims()),
+            sign(generate(), 'key1', self.claims()),
+            sign(KEY, 'key1', self.claims())[:-4] + 'AAAA',
+            'token',
+        )
+        for token in invalid:
+            with self.assertRaises(idtoken.InvalidToken):
+                idtoken.verify(token, keys=keys, audience='client', issuers=issuers)
+
+    @override_settings(OAUTH_GOOGLE_CLIENT_ID='client')
+    def test_identity(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Google)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        url = 'http://127.0.0.1:{port}'.format(port=server.server_address[1])
+        provider = oauth.get('google')
+        provider._keys_expires = 0
+
+        endpoints = {'google': {'jwks_url': url + '/certs', 'userinfo_url': url + '/userinfo'}}
+        with self.settings(TASKER_ACCOUNT_OAUTH_ENDPOINTS=endpoints):
+            for _ in range(2):
+                info = provider.identity({'access_token': 'token', 'id_token': sign(KEY, 'key1', self.claims())})
+                profile = provider.profile(token={}, info=info)
+                self.assertEqual(profile.get('id'), '1234567890')
+                self.assertEqual(profile.get('email'), 'kazerogova@gmail.com')
+                self.assertEqual(profile.get('first_name'), 'Лилу')
+
+        # The key set is cached, the userinfo endpoint is not called
+        self.assertEqual(Google.requests, ['/certs'])
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from django_tasker_account import models
+
+
+class ImportAccounts(TestCase):
+    def setUp(self) -> None:
+        User.objects.create_user(username='username')
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(text)
+        return path
+
+    def test_csv(self):
+        path = self.write('accounts.csv', "\n".join([
+            'username,first_name,last_name,password',
+            'Kazerogova,Lilu,Kazerogova,{hash}'.format(hash=make_password('Qazwsx123')),
+            'kazerogova2,Lilu,Kazerogova,Qazwsx123',
+            'username,Duplicate,Database,',
+            'kazerogova,Duplicate,File,',
+            '1invalid,Invalid,Username,',
+        ]))
+
+        rejects = os.path.join(self.directory.name, 'rejects.jsonl')
+        stdout = StringIO()
+        call_command('import_accounts', path, chunk_size=2, rejects=rejects, stdout=stdout)
+        self.assertIn('processed:5 created:2 rejected:3', stdout.getvalue())
+
+        user = User.objects.get(username='kazerogova')
+        self.assertTrue(user.check_password('Qazwsx123'))
+        self.assertEqual(user.profile.language, 'en')
+        self.assertTrue(User.objects.get(username='kazerogova2').check_password('Qazwsx123'))
+
+        with open(rejects, encoding='utf-8') as stream:
+            lines = sorted(json.loads(line)['line'] for line in stream)
+        self.assertEqual(lines, [4, 5, 6])
+
+    def test_jsonl(self):
+        path = self.write('accounts.jsonl', "\n".join([
+            json.dumps({'username': 'kazerogova', 'provider': 'google', 'oauth_id': '100', 'access_token': 'token'}),
+            'not json',
+        ]))
+
+        stdout = StringIO()
+        stderr = StringIO()
+        call_command('import_accounts', path, stdout=stdout, stderr=stderr)
+        self.assertIn('processed:2 created:1 rejected:1', stdout.getvalue())
+
+        oauth = models.Oauth.objects.get(provider=1)
+        self.assertEqual(oauth.user.username, 'kazerogova')
+        self.assertEqual(len(oauth.oauth_id), 64)
+
+    def test_conflict(self):
+        models.Oauth.objects.create(
+            user=User.objects.get(username='username'),
+            oauth_id=hashlib.sha256(b'100').hexdigest(),
+            provider=1,
+            expires_in='2020-01-01T00:00:00Z',
+        )
+
+        path = self.write('accounts.jsonl', "\n".join([
+            json.dumps({'username': 'kazerogova', 'provider': 'google', 'oauth_id': '100'}),
+            json.dumps({'username': 'kazerogova2', 'email': 'kazerogova2@example.com'}),
+        ]))
+
+        stdout = StringIO()
+        stderr = StringIO()
+        call_command('import_accounts', path, stdout=stdout, stderr=stderr)
+        self.assertIn('processed:2 created:1 rejected:1', stdout.getvalue())
+        self.assertEqual(json.loads(stderr.getvalue())['line'], 1)
+
+        # The conflicting account is not created without its OAuth link
+        self.assertFalse(User.objects.filter(username='kazerogova').exists())
+        self.assertEqual(User.objects.get(username='kazerogova2').profile.email_canonical, 'kazerogova2@example.com')
+        self.assertFalse(User.objects.filter(profile__isnull=True).exists())
@@ -1,7 +1,11 @@
+from contextlib import redirect_stdout
+from io import StringIO
+
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase, override_settings, RequestFactory
 
-from django_tasker_account import forms, views
+from django_tasker_account import forms, views, throttle, hashing
 from . import test_base
 
 
@@ -93,3 +97,88 @@ class Login(TestCase, test_base.Request):
         request = self.generate_request(request)
         response = views.login(request)
         self.assertEqual(response.status_code, 400)
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        TASKER_ACCOUNT_LOGIN_THROTTLE={'ip': (3, 60), 'network': (5, 60), 'username': (4, 600)},
+    )
+    def test_throttle(self):
+        factory = RequestFactory(HTTP_HOST='localhost')
+
+        def request(username, ip='192.0.2.1'):
+            data = {'username': username, 'password': 'Qazwsx124'}
+            return self.generate_request(factory.post('/accounts/login/', data, REMOTE_ADDR=ip))
+
+        def login(username, ip='192.0.2.1'):
+            return views.login(request(username, ip))
+
+        for index in range(3):
+            self.assertEqual(login('username').status_code, 400)
+
+        # The IP is over the limit, the password is not checked
+        throttled = request('username')
+        with self.assertNumQueries(0):
+            response = views.login(throttled)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) > 0)
+
+        # A spoofed X-Forwarded-For does not reset the counter of the address
+        spoofed = factory.post('/accounts/login/', {'username': 'spoofed', 'password': 'Qazwsx124'},
+                               REMOTE_ADDR='192.0.2.1', HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(views.login(self.generate_request(spoofed)).status_code, 429)
+        self.assertEqual(throttle.client_ip(spoofed), '192.0.2.1')
+
+        # Behind one trusted proxy the address added by the proxy is used, not the client part of the header
+        with self.settings(TASKER_ACCOUNT_THROTTLE_PROXIES=1):
+            proxied = factory.post('/accounts/login/', REMOTE_ADDR='10.0.0.1',
+                                   HTTP_X_FORWARDED_FOR='203.0.113.7, 192.0.2.1')
+            self.assertEqual(throttle.client_ip(proxied), '192.0.2.1')
+            self.assertEqual(views.login(self.generate_request(proxied)).status_code, 429)
+
+        # Same account from another address of the network
+        self.assertEqual(login('USERNAME', ip='192.0.2.2').status_code, 400)
+        self.assertEqual(login('username', ip='192.0.2.3').status_code, 429)
+
+        # The network is over the limit
+        self.assertEqual(login('another', ip='192.0.2.4').status_code, 400)
+        self.assertEqual(login('another', ip='192.0.2.5').status_code, 429)
+        self.assertEqual(login('another', ip='198.51.100.1').status_code, 400)
+
+        self.assertEqual(throttle.network('2001:db8::1'), '2001:db8::/64')
+
+        stdout = StringIO()
+        with redirect_stdout(stdout):
+            call_command('login_throttle', ip='192.0.2.1', username='Username', clear=True)
+        self.assertIn('ip 192.0.2.1: attempts:0.0, limit:3, window:60s', stdout.getvalue())
+        self.assertIn('username username: attempts:0.0', stdout.getvalue())
+        self.assertEqual(login('username').status_code, 400)
+
+    @override_settings(TASKER_ACCOUNT_HASHING_CONCURRENCY=1, TASKER_ACCOUNT_HASHING_QUEUE=0)
+    def test_overloaded(self):
+        hashing.reset()
+        factory = RequestFactory(HTTP_HOST='localhost')
+
+        def request():
+            data = {'username': 'username', 'password': 'Qazwsx123'}
+            return self.generate_request(factory.post('/accounts/login/', data))
+
+        # All slots are busy and the queue is full
+        with hashing.slot():
+            with self.assertLogs('tasker_account', level='WARNING') as logs:
+                response = views.login(request())
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Hashing unavailable path:/accounts/login/, calls:1, overloaded:1, waiting:0', logs.output[-1])
+        self.assertEqual(response['Retry-After'], '1')
+
+        self.assertEqual(views.login(request()).status_code, 302)
+
+        # Waited in the queue until the timeout
+        with override_settings(TASKER_ACCOUNT_HASHING_QUEUE=1, TASKER_ACCOUNT_HASHING_TIMEOUT=0.05):
+            with hashing.slot():
+                with self.assertRaises(hashing.Overloaded):
+                    hashing.make_password('Qazwsx123')
+
+        stats = hashing.stats()
+        self.assertEqual(stats.get('overloaded'), 2)
+        self.assertEqual(stats.get('waiting'), 0)
+        self.assertGreaterEqual(stats.get('wait_max'), 0.05)
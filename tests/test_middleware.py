@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings, RequestFactory
+from django.utils import translation
+
+from django_tasker_account import middleware
+
+
+@override_settings(
+    ALLOWED_HOSTS=['localhost'],
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+)
+class Account(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username='username', password='Qazwsx123')
+        self.user.profile.language = 'ru'
+        self.user.profile.save()
+
+    def test_session(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get('/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.session[middleware.SESSION_KEY], {'language': 'ru', 'timezone': None})
+
+        # Session and user only, the profile is not loaded
+        with self.assertNumQueries(2):
+            self.client.get('/', HTTP_HOST='localhost')
+
+        # Login resolves the context again
+        self.user.profile.language = 'en'
+        self.user.profile.save()
+        self.client.force_login(self.user)
+        self.client.get('/', HTTP_HOST='localhost')
+        self.assertEqual(self.client.session[middleware.SESSION_KEY]['language'], 'en')
+
+    def test_anonymous(self):
+        factory = RequestFactory(HTTP_HOST='localhost')
+        request = factory.get('/')
+        request.session = {}
+
+        account = middleware.Account(lambda r: None)
+        with self.assertNumQueries(0):
+            self.assertIsNone(account.context(request))
+
+        request = factory.get('/static/style.css')
+        self.assertIsNone(account.context(request))
+
+    def test_timezone(self):
+        self.assertIs(middleware.get_timezone('Europe/Moscow'), middleware.get_timezone('Europe/Moscow'))
+
+    def tearDown(self) -> None:
+        translation.deactivate()
@@ -1,21 +1,53 @@
+import base64
 import hashlib
+import hmac
+import json
+import threading
 from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from importlib import import_module
+from io import StringIO
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db.models import BinaryField
+from django.db.models.functions import Cast
 from django.test import TestCase, override_settings, RequestFactory
 from django.urls import reverse
 
-from django_tasker_account import views, converters
+from django_tasker_account import views, converters, oauth, models, usernames, validators, forms
+from django_tasker_account.fakeprovider import FakeProvider
 from . import test_base
 
 
+class Disconnect(BaseHTTPRequestHandler):
+    # Methods of the requests, the connection is closed without a response
+    calls = []
+
+    def do_GET(self):
+        self.calls.append('GET')
+        self.close_connection = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.calls.append('POST')
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
 @override_settings(
     ALLOWED_HOSTS=['localhost'],
     CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
 )
 class OAuth(TestCase, test_base.Request):
+    @override_settings(
+        OAUTH_GOOGLE_CLIENT_ID='client', OAUTH_YANDEX_CLIENT_ID='client', OAUTH_MAILRU_CLIENT_ID='client',
+        OAUTH_VK_CLIENT_ID='client', OAUTH_FACEBOOK_CLIENT_ID='client',
+    )
     def test_view(self):
         factory = RequestFactory(HTTP_HOST='localhost')
 
@@ -81,3 +113,279 @@ class OAuth(TestCase, test_base.Request):
         user = User.objects.filter(username="kazerogova")
         self.assertTrue(user.exists())
 
+
+    def test_providers(self):
+        self.assertEqual([provider.id for provider in oauth.providers.values()], [1, 2, 3, 4, 5])
+
+        provider = oauth.get('mailru')
+        self.assertIs(provider.http, provider.http)
+        self.assertIsNot(provider.http, oauth.get('google').http)
+        self.assertEqual(provider.http.get_adapter('https://oauth.mail.ru/token')._pool_maxsize, 10)
+
+        info = provider.profile(token={}, info={
+            'email': 'Kazerogova.Lilu@Mail.ru',
+            'first_name': 'Лилу',
+            'last_name': 'Казерогова',
+            'birthday': '01.01.1981',
+            'gender': 'f',
+        })
+        self.assertEqual(info.get('email'), 'kazerogova.lilu@mail.ru')
+        self.assertEqual(info.get('username'), 'kazerogova_lilu')
+        self.assertEqual(info.get('birth_date'), '1981-01-01')
+        self.assertEqual(info.get('gender'), 2)
+        self.assertIsNone(provider.check(info))
+
+        self.assertEqual(provider.check({'email': 'devnull@gmail.com'}), provider.domains_error)
+        self.assertIsNone(oauth.get('vk').check({'email': None}))
+
+        info = oauth.get('vk').profile(token={'user_id': 1}, info={'screen_name': 'id1'})
+        self.assertIsNone(info.get('username'))
+        self.assertEqual(info.get('id'), 1)
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        TASKER_ACCOUNT_OAUTH_BREAKER_MIN_CALLS=2,
+        TASKER_ACCOUNT_OAUTH_BACKOFF=0,
+    )
+    def test_breaker(self):
+        provider = oauth.get('facebook')
+        provider.breaker.reset()
+
+        # Nothing listens on the port
+        with self.assertRaises(oauth.Unavailable):
+            provider.request('GET', 'http://127.0.0.1:1/')
+        self.assertFalse(provider.breaker.is_open())
+        self.assertEqual(provider.breaker.state().get('errors'), 1)
+
+        with self.assertRaises(oauth.Unavailable):
+            provider.request('POST', 'http://127.0.0.1:1/')
+        self.assertTrue(provider.breaker.is_open())
+
+        with self.assertRaisesMessage(oauth.Unavailable, 'Breaker is open'):
+            provider.request('GET', 'http://127.0.0.1:1/')
+
+        # The sign-in fails fast, the provider is not called
+        fake = FakeProvider().start()
+        self.addCleanup(fake.stop)
+
+        factory = RequestFactory(HTTP_HOST='localhost')
+        url = reverse('django_tasker_account:oauth_facebook')
+        with self.settings(TASKER_ACCOUNT_OAUTH_ENDPOINTS=fake.endpoints(), OAUTH_FACEBOOK_CLIENT_ID='client'):
+            response = views.oauth_facebook(self.generate_request(factory.get(url, {'code': '42'})))
+            self.assertEqual(response.url, '/')
+            self.assertEqual(sum(fake.calls.values()), 0)
+
+            call_command('oauth_breaker', 'facebook', '--reset', stdout=StringIO())
+            self.assertFalse(provider.breaker.is_open())
+
+            views.oauth_facebook(self.generate_request(factory.get(url, {'code': '42'})))
+            self.assertEqual(fake.calls['/facebook/access_token'], 1)
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        TASKER_ACCOUNT_OAUTH_RETRIES=2,
+        TASKER_ACCOUNT_OAUTH_BACKOFF=0,
+    )
+    def test_retry_sent(self):
+        provider = oauth.get('facebook')
+        provider.breaker.reset()
+        self.addCleanup(provider.breaker.reset)
+
+        Disconnect.calls = []
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Disconnect)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:{port}/token'.format(port=server.server_address[1])
+
+        # The POST reached the provider, the code may be used already
+        with self.assertRaises(oauth.Unavailable):
+            provider.request('POST', url, data={'code': '42'})
+        self.assertEqual(Disconnect.calls, ['POST'])
+
+        with self.assertRaises(oauth.Unavailable):
+            provider.request('GET', url)
+        self.assertEqual(Disconnect.calls, ['POST', 'GET', 'GET', 'GET'])
+
+    @override_settings(OAUTH_FACEBOOK_CLIENT_ID='client', OAUTH_FACEBOOK_SECRET_KEY='secret')
+    def test_linked(self):
+        fake = FakeProvider().start()
+        self.addCleanup(fake.stop)
+
+        user = User.objects.create_user(username='kazerogova')
+        models.Oauth.objects.create(
+            user=user,
+            provider=5,
+            oauth_id=hashlib.sha256(b'42').hexdigest(),
+            access_token='access_token',
+            expires_in=datetime.now(timezone.utc),
+        )
+
+        factory = RequestFactory(HTTP_HOST='localhost')
+        request = factory.get(reverse('django_tasker_account:oauth_facebook'), {'code': '42', 'state': '/next'})
+        request = self.generate_request(request)
+
+        with self.settings(TASKER_ACCOUNT_OAUTH_ENDPOINTS=fake.endpoints()):
+            response = views.oauth_facebook(request)
+
+        # Logged in by the callback, the completion step is skipped
+        self.assertEqual(response.url, '/next')
+        self.assertEqual(request.session.get('_auth_user_id'), str(user.pk))
+        self.assertEqual(fake.calls['/facebook/access_token'], 1)
+        self.assertEqual(fake.calls['/facebook/me'], 1)
+
+        user.refresh_from_db()
+        self.assertEqual(user.first_name, 'Given')
+
+        # The tokens of the link are updated, a legacy link without the refresh token becomes refreshable
+        link = models.Oauth.objects.get(user=user)
+        self.assertEqual(link.access_token, 'token-42')
+        self.assertEqual(link.refresh_token, '42')
+        self.assertGreater(link.expires_in, datetime.now(timezone.utc) + timedelta(minutes=50))
+
+    def test_completion_linked(self):
+        user = User.objects.create_user(username='kazerogova')
+        models.Oauth.objects.create(
+            user=user,
+            provider=1,
+            oauth_id=hashlib.sha256(b'test_id').hexdigest(),
+            access_token='access_token',
+            refresh_token='refresh_token',
+            expires_in=datetime.now(timezone.utc),
+        )
+
+        dt = datetime.now(timezone.utc) + timedelta(hours=1)
+
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session["oauth"] = {
+            'provider': 1,
+            'id': hashlib.sha256(b'test_id').hexdigest(),
+            'access_token': 'new_token',
+            'expires_in': dt.isoformat(),
+            'module': 'django_tasker_account.views',
+            'next': '/next',
+            'first_name': 'Лилу',
+        }
+        session.create()
+
+        factory = RequestFactory(HTTP_HOST='localhost')
+        url = reverse('django_tasker_account:oauth_completion', kwargs={'data': session.session_key})
+        request = self.generate_request(factory.get(url))
+        response = views.oauth_completion(request, data=converters.OAuth().to_python(session_key=session.session_key))
+
+        self.assertEqual(response.url, '/next')
+        self.assertEqual(request.session.get('_auth_user_id'), str(user.pk))
+
+        # The refresh token is kept when the payload has none
+        link = models.Oauth.objects.get(user=user)
+        self.assertEqual(link.access_token, 'new_token')
+        self.assertEqual(link.refresh_token, 'refresh_token')
+        self.assertEqual(link.expires_in, dt)
+
+    @override_settings(
+        OAUTH_GOOGLE_CLIENT_ID='client', OAUTH_YANDEX_CLIENT_ID='client', OAUTH_MAILRU_CLIENT_ID='client',
+        OAUTH_VK_CLIENT_ID='client', OAUTH_FACEBOOK_CLIENT_ID='client',
+    )
+    def test_fake_provider(self):
+        fake = FakeProvider().start()
+        self.addCleanup(fake.stop)
+
+        with self.settings(TASKER_ACCOUNT_OAUTH_ENDPOINTS=fake.endpoints()):
+            for name in oauth.providers:
+                url = reverse('django_tasker_account:oauth_{name}'.format(name=name))
+                response = self.client.get(url, {'code': 'kazerogova_' + name}, HTTP_HOST='localhost')
+                self.assertRegex(response.url, r'/accounts/oauth/completion/')
+
+                response = self.client.get(response.url, HTTP_HOST='localhost')
+                if response.status_code == 200:
+                    response = self.client.post(
+                        response.wsgi_request.path, {'username': 'kazerogova_' + name}, HTTP_HOST='localhost',
+                    )
+
+                self.assertEqual(response.status_code, 302)
+                # The login at the provider, Facebook has no email and the username comes from the names
+                username = 'given_family' if name == 'facebook' else 'kazerogova_' + name
+                self.assertTrue(models.Oauth.objects.filter(
+                    provider=oauth.get(name).id, user__username=username,
+                ).exists())
+
+                # Returning user
+                self.client.logout()
+                response = self.client.get(url, {'code': 'kazerogova_' + name}, HTTP_HOST='localhost')
+                self.assertEqual(response.url, '/')
+
+    @override_settings(OAUTH_FACEBOOK_SECRET_KEY='secret')
+    def test_facebook_deactivate(self):
+        def signed_request(data, secret='secret'):
+            payload = base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).rstrip(b'=').decode('ascii')
+            sig = hmac.new(secret.encode(), msg=payload.encode(), digestmod=hashlib.sha256).digest()
+            return base64.urlsafe_b64encode(sig).rstrip(b'=').decode('ascii') + '.' + payload
+
+        user = User.objects.create_user(username='kazerogova')
+        models.Oauth.objects.create(
+            user=user,
+            provider=5,
+            oauth_id=hashlib.sha256(b'42').hexdigest(),
+            access_token='access_token',
+            expires_in=datetime.now(timezone.utc),
+        )
+
+        factory = RequestFactory(HTTP_HOST='localhost')
+        url = reverse('django_tasker_account:oauth_facebook_deactivate')
+
+        for data in ('bad', signed_request({'algorithm': 'HMAC-SHA256', 'user_id': '42'}, secret='other')):
+            response = views.oauth_facebook_deactivate(factory.post(url, {'signed_request': data}))
+            self.assertEqual(response.status_code, 400)
+
+        data = signed_request({'algorithm': 'HMAC-SHA256', 'user_id': '42'})
+        response = views.oauth_facebook_deactivate(factory.post(url, {'signed_request': data}))
+        self.assertEqual(response.status_code, 200)
+
+        # Deleted by the worker
+        self.assertTrue(models.Oauth.objects.filter(user=user).exists())
+        call_command('oauth_deauthorize', stdout=StringIO())
+        self.assertFalse(models.Oauth.objects.filter(user=user).exists())
+        self.assertFalse(models.Deauthorization.objects.exists())
+
+    def test_oauth_id(self):
+        oauth_id = hashlib.sha256(b'42').hexdigest()
+        link = models.Oauth.objects.create(
+            user=User.objects.create_user(username='kazerogova'),
+            provider=5,
+            oauth_id=oauth_id,
+            access_token='access_token',
+            expires_in=datetime.now(timezone.utc),
+        )
+
+        # Raw 32 bytes in the database, the hex string in Python
+        raw = models.Oauth.objects.filter(pk=link.pk).values_list(Cast('oauth_id', BinaryField()), flat=True).get()
+        self.assertEqual(bytes(raw), hashlib.sha256(b'42').digest())
+        self.assertEqual(models.Oauth.objects.get(oauth_id=oauth_id, provider=5).oauth_id, oauth_id)
+
+        with self.assertRaises(ValidationError):
+            models.Oauth.objects.filter(oauth_id='42').exists()
+
+    def test_usernames(self):
+        self.assertEqual(usernames.clean('1Kazerogova.Lilu.Mail'), 'kazerogova_lilumail')
+        self.assertEqual(usernames.clean('Лилу'), '')
+
+        candidates = usernames.candidates('kazerogova.lilu', first_name='Lilu', last_name='Kazerogova')
+        self.assertEqual(len(candidates), 10)
+        self.assertEqual(candidates[:3], ['kazerogova_lilu', 'kazerogovalilu', 'lilu_kazerogova'])
+        for candidate in candidates:
+            validators.username(candidate)
+
+        User.objects.create_user(username='Kazerogova_Lilu')
+        User.objects.create_user(username='kazerogovalilu')
+
+        # All candidates in one query
+        with self.assertNumQueries(1):
+            self.assertEqual(usernames.suggest('kazerogova.lilu', 'Lilu', 'Kazerogova'), 'lilu_kazerogova')
+
+        self.assertIsNone(usernames.suggest(None, 'Лилу', 'Казерогова'))
+
+        # Taken username in the completion form
+        form = forms.OAuth(data={'username': 'kazerogovalilu'})
+        self.assertTrue(form.is_valid())
+        form.add_errors(ValidationError({'username': ValidationError('A user with that username already exists.')}))
+        self.assertIn('Username kazerogovalilu1 is available', form.errors.get('username'))
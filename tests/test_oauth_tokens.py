@@ -0,0 +1,120 @@
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from django_tasker_account import models
+
+
+class Yandex(BaseHTTPRequestHandler):
+    # Refresh tokens of the requests
+    calls = []
+
+    def do_POST(self):
+        data = parse_qs(self.rfile.read(int(self.headers.get('Content-Length'))).decode('utf-8'))
+        self.calls.append(data.get('refresh_token')[0])
+        if data.get('refresh_token') == ['revoked']:
+            status, body = 400, {'error': 'invalid_grant'}
+        elif data.get('refresh_token')[0].startswith('short'):
+            status, body = 200, {'access_token': 'new_' + data.get('refresh_token')[0], 'expires_in': 1800}
+        elif data.get('refresh_token')[0].startswith('lifetime'):
+            status, body = 200, {'access_token': 'new_' + data.get('refresh_token')[0]}
+        else:
+            status, body = 200, {'access_token': 'new_' + data.get('refresh_token')[0], 'expires_in': 3600}
+
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    OAUTH_YANDEX_CLIENT_ID='client',
+    OAUTH_YANDEX_SECRET_KEY='secret',
+)
+class OauthTokens(TestCase):
+    def serve(self):
+        Yandex.calls = []
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Yandex)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return 'http://127.0.0.1:{port}/token'.format(port=server.server_address[1])
+
+    def test_refresh(self):
+        url = self.serve()
+
+        now = datetime.now(timezone.utc)
+        rows = {
+            'expiring': ('refresh1', now + timedelta(minutes=10)),
+            'expired': ('refresh2', now - timedelta(days=10)),
+            'revoked': ('revoked', now),
+            'later': ('refresh3', now + timedelta(days=10)),
+            'offline': ('', now),
+        }
+        for username, (refresh_token, expires_in) in rows.items():
+            models.Oauth.objects.create(
+                user=User.objects.create_user(username=username),
+                provider=2,
+                oauth_id=hashlib.sha256(username.encode('utf-8')).hexdigest(),
+                access_token='old',
+                refresh_token=refresh_token,
+                expires_in=expires_in,
+            )
+
+        stdout = StringIO()
+        with self.settings(TASKER_ACCOUNT_OAUTH_ENDPOINTS={'yandex': {'token_url': url}}):
+            call_command('oauth_tokens', 'yandex', '--chunk-size=2', stdout=stdout)
+
+        self.assertIn('Done processed:3 refreshed:2 revoked:1 failed:0', stdout.getvalue())
+
+        tokens = dict(models.Oauth.objects.values_list('user__username', 'access_token'))
+        self.assertEqual(tokens, {
+            'expiring': 'new_refresh1',
+            'expired': 'new_refresh2',
+            'later': 'old',
+            'offline': 'old',
+        })
+        self.assertGreater(models.Oauth.objects.get(user__username='expired').expires_in, now + timedelta(minutes=50))
+
+    def test_window(self):
+        url = self.serve()
+
+        # Tokens living shorter than the window stay in it after the refresh
+        now = datetime.now(timezone.utc)
+        names = ['short1', 'short2', 'short3', 'lifetime1', 'lifetime2']
+        for minute, name in enumerate(names):
+            models.Oauth.objects.create(
+                user=User.objects.create_user(username=name),
+                provider=2,
+                oauth_id=hashlib.sha256(name.encode('utf-8')).hexdigest(),
+                access_token='old',
+                refresh_token=name,
+                expires_in=now + timedelta(minutes=minute),
+            )
+
+        stdout = StringIO()
+        with self.settings(TASKER_ACCOUNT_OAUTH_ENDPOINTS={'yandex': {'token_url': url}}):
+            call_command('oauth_tokens', 'yandex', '--chunk-size=1', '--window=7200', stdout=stdout)
+
+        self.assertIn('Done processed:5 refreshed:5 revoked:0 failed:0', stdout.getvalue())
+        self.assertEqual(sorted(Yandex.calls), sorted(names))
+
+        # A response without expires_in is not taken as an expired token
+        self.assertGreater(
+            models.Oauth.objects.get(user__username='lifetime1').expires_in,
+            now + timedelta(minutes=110),
+        )
@@ -0,0 +1,122 @@
+import smtplib
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.test import TestCase, override_settings, RequestFactory
+
+from django_tasker_account import forms, models
+from django_tasker_account import mail as outbox
+from . import test_base
+
+
+class Backend(locmem.EmailBackend):
+    """
+    Counts the connections, fails the recipients of the refused and the down domains
+    """
+    opened = 0
+
+    def open(self):
+        if getattr(self, 'connection', None) is None:
+            self.connection = True
+            Backend.opened += 1
+            return True
+
+    def close(self):
+        self.connection = None
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.to[0].endswith('@refused.example.com'):
+                raise smtplib.SMTPRecipientsRefused({message.to[0]: (550, b'User unknown')})
+            if message.to[0].endswith('@down.example.com'):
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+
+@override_settings(
+    ALLOWED_HOSTS=['localhost'],
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    EMAIL_BACKEND='tests.test_outbox.Backend',
+    TASKER_ACCOUNT_EMAIL_OUTBOX=True,
+)
+class Outbox(TestCase, test_base.Request):
+    def setUp(self) -> None:
+        Backend.opened = 0
+
+    def test_forms(self):
+        User.objects.create_user(username='username', email='user@example.com')
+
+        request = self.generate_request(RequestFactory(HTTP_HOST='localhost').get('/'))
+        form = forms.ForgotPassword(data={'email': 'user@example.com'}, request=request)
+        self.assertTrue(form.is_valid())
+        form.sendmail()
+
+        # Written inside the request, sent by the worker
+        self.assertEqual(len(mail.outbox), 0)
+        row = models.Outbox.objects.get()
+        self.assertEqual(row.status, models.Outbox.PENDING)
+        self.assertEqual(row.to, 'user@example.com')
+
+        stdout = StringIO()
+        call_command('send_outbox', stdout=stdout)
+        self.assertIn('Done sent:1 retried:0 failed:0', stdout.getvalue())
+
+        message = mail.outbox.pop()
+        self.assertEqual(message.subject, 'Password recovery')
+        self.assertEqual(message.extra_headers.get('Message-ID'), row.message_id)
+        self.assertRegex(message.body, '/accounts/change/password/')
+
+        row.refresh_from_db()
+        self.assertEqual(row.status, models.Outbox.SENT)
+        self.assertIsNotNone(row.sent)
+
+    def test_process(self):
+        for address in ('one@example.com', 'two@example.com', 'user@refused.example.com', 'user@down.example.com'):
+            outbox.send(outbox.message('django_tasker_account/email/signup', address, {'url': '/'}))
+
+        self.assertEqual(outbox.process(), (2, 1, 1))
+        self.assertEqual(len(mail.outbox), 2)
+
+        # One connection for the batch, reopened after the disconnect
+        self.assertEqual(Backend.opened, 2)
+
+        self.assertEqual(models.Outbox.objects.get(to='user@refused.example.com').status, models.Outbox.FAILED)
+        row = models.Outbox.objects.get(to='user@down.example.com')
+        self.assertEqual(row.status, models.Outbox.PENDING)
+        self.assertEqual(row.attempts, 1)
+        self.assertIn('Connection unexpectedly closed', row.error)
+
+        # Retried later
+        self.assertEqual(outbox.process(), (0, 0, 0))
+
+    @override_settings(TASKER_ACCOUNT_EMAIL_OUTBOX=False)
+    def test_disabled(self):
+        self.assertIsNone(outbox.send(outbox.message('django_tasker_account/email/signup', 'one@example.com', {})))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(models.Outbox.objects.exists())
+
+    def test_render_many(self):
+        template = 'django_tasker_account/email/forgot_password'
+        messages = outbox.render_many(template, [
+            ('one@example.com', {'url': '/accounts/change/password/one/'}),
+            ('two@example.com', {'url': '/accounts/change/password/two/'}),
+        ], host='localhost', language='ru')
+
+        self.assertEqual([message.subject for message in messages], ['Восстановление пароля'] * 2)
+        self.assertIn('https://localhost/accounts/change/password/one/', messages[0].body)
+        self.assertIn('https://localhost/accounts/change/password/two/', messages[1].body)
+        self.assertNotIn('/one/', messages[1].body)
+        self.assertNotEqual(messages[0].extra_headers['Message-ID'], messages[1].extra_headers['Message-ID'])
+
+        # Compiled once, the subject is cached per language
+        self.assertIn(template, outbox._templates)
+        self.assertEqual(outbox.subject(template, 'en-us'), 'Password recovery')
+        self.assertEqual(outbox.subject(template, 'ru'), 'Восстановление пароля')
+
+        self.assertEqual(outbox.send_many(messages), 2)
+        self.assertEqual(models.Outbox.objects.count(), 2)
+        self.assertEqual(outbox.process(), (2, 0, 0))
+        self.assertEqual(Backend.opened, 1)
@@ -1,9 +1,11 @@
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
 from django.shortcuts import get_object_or_404
 from django.test import TestCase, override_settings, RequestFactory
 from django.urls import reverse
 
-from django_tasker_account import forms, views
+from django_tasker_account import forms, views, models, admin
 from . import test_base
 
 
@@ -74,3 +76,53 @@ class Profile(TestCase, test_base.Request):
         self.assertEqual(user.profile.language, 'ru')
 
         self.assertEqual(user.profile.get_gender_display(), 'Male')
+
+    def test_signal(self):
+        self.assertTrue(models.Profile.objects.filter(user=self.user).exists())
+
+        # Saving the user does not touch the profile
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=['last_login'])
+
+        users = User.objects.bulk_create([User(username='bulk1'), User(username='bulk2')])
+        users = User.objects.filter(username__in=['bulk1', 'bulk2', 'username'])
+        models.Profile.objects.bulk_create_for(users)
+        self.assertEqual(models.Profile.objects.filter(user__in=users).count(), 3)
+
+        # The canonical email of another profile is not silently dropped
+        User.objects.bulk_create([User(username='bulk3', email='DevNull@Example.com')])
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                models.Profile.objects.bulk_create_for(User.objects.filter(username='bulk3'))
+
+    def test_email_conflict(self):
+        other = User.objects.create_user(username='other', email='other@example.com')
+
+        # The canonical email of another user
+        other.email = 'DevNull@Example.com'
+        with self.assertRaises(ValidationError) as error:
+            with transaction.atomic():
+                other.save()
+        self.assertEqual(set(error.exception.error_dict), {'email'})
+
+        other.refresh_from_db()
+        self.assertEqual(other.email, 'other@example.com')
+        self.assertEqual(other.profile.email_canonical, 'other@example.com')
+
+        # Without a transaction the user row is not written either
+        other.email = 'DevNull@Example.com'
+        with self.assertRaises(ValidationError):
+            other.save()
+        other.refresh_from_db()
+        self.assertEqual(other.email, 'other@example.com')
+
+        # The admin form reports the conflict instead of failing on the save
+        form = admin.UserChangeForm(instance=other, data={
+            'username': 'other',
+            'email': 'devnull@example.com',
+            'date_joined_0': '2020-01-01',
+            'date_joined_1': '00:00:00',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertTrue(form.has_error('email'))
+        self.assertIsInstance(admin.admin.site._registry.get(User), admin.UserAdmin)
@@ -1,9 +1,14 @@
+from importlib import import_module
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.exceptions import ValidationError
 from django.test import TestCase, override_settings, RequestFactory
 from django.core import mail
 from django.urls import reverse
 
-from django_tasker_account import forms, views, converters
+from django_tasker_account import forms, views, converters, validators, models, hashing
 from . import test_base
 
 
@@ -127,6 +132,51 @@ class Signup(TestCase, test_base.Request):
             ),
             message.body)
 
+    def test_uniqueness(self):
+        with self.assertNumQueries(1):
+            errors = validators.uniqueness(username='USERNAME', email='devnull@example.com')
+        self.assertEqual(set(errors), {'username', 'email'})
+
+        with self.assertNumQueries(1):
+            self.assertEqual(validators.uniqueness(username='username2', email='user@example.com'), {})
+
+        form = forms.Signup(data={
+            'username': 'username',
+            'last_name': 'last_name',
+            'first_name': 'first_name',
+            'email': 'devnull@example.com',
+        })
+        self.assertTrue(form.has_error('username'))
+        self.assertTrue(form.has_error('email'))
+
+        with self.assertNumQueries(0):
+            form.uniqueness('username', 'devnull@example.com')
+
+    def test_create_user(self):
+        with self.assertRaises(ValidationError) as error:
+            models.create_user(username='USERNAME', email='new@example.com')
+        self.assertEqual(set(error.exception.error_dict), {'username'})
+
+        with self.assertRaises(ValidationError) as error:
+            models.create_user(username='username2', email='DevNull@example.com')
+        self.assertEqual(set(error.exception.error_dict), {'email'})
+        self.assertFalse(User.objects.filter(username='username2').exists())
+
+        # The form passed validation, another user took the username before the insert
+        form = forms.Signup(data={
+            'username': 'username2',
+            'last_name': 'last_name',
+            'first_name': 'first_name',
+            'email': 'user@example.com',
+            'password1': 'a779894c60365e80efdfe0f7172ebe2063e99e08',
+            'password2': 'a779894c60365e80efdfe0f7172ebe2063e99e08'
+        })
+        self.assertTrue(form.is_valid())
+        models.create_user(username='username2')
+
+        self.assertIsNone(form.save())
+        self.assertTrue(form.has_error('username'))
+
     def test_views(self):
         factory = RequestFactory(HTTP_HOST='localhost')
         request = factory.post(reverse('django_tasker_account:signup'), data={
@@ -169,6 +219,7 @@ class Signup(TestCase, test_base.Request):
         self.assertTrue(form.is_valid())
 
         session = form.confirmation()
+        self.assertIsNone(session.get('password1'))
         confirm_email = converters.ConfirmEmail().to_python(session_key=session.session_key)
 
         self.assertEqual(confirm_email.module, 'django_tasker_account.forms')
@@ -191,3 +242,73 @@ class Signup(TestCase, test_base.Request):
         self.assertEqual(user.first_name, 'first_name')
         self.assertEqual(user.email, 'user@example.com')
         self.assertEqual(user.profile.language, 'en')
+        self.assertTrue(user.check_password('a779894c60365e80efdfe0f7172ebe2063e99e08'))
+
+    @override_settings(TASKER_ACCOUNT_HASHING_CONCURRENCY=1, TASKER_ACCOUNT_HASHING_QUEUE=0)
+    def test_views_confirm_email_overloaded(self):
+        # Session created before the password was hashed at signup
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session.update({
+            'username': 'username2',
+            'last_name': 'last_name',
+            'first_name': 'first_name',
+            'email': 'user@example.com',
+            'password1': 'a779894c60365e80efdfe0f7172ebe2063e99e08',
+            'password2': 'a779894c60365e80efdfe0f7172ebe2063e99e08',
+            'module': 'django_tasker_account.forms',
+            'next': '/',
+        })
+        session.create()
+
+        factory = RequestFactory(HTTP_HOST='localhost')
+        request = self.generate_request(factory.get('/confirm/email/{key}/'.format(key=session.session_key)))
+        with hashing.slot():
+            response = views.confirm_email(request, data=converters.ConfirmEmail().to_python(session.session_key))
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(User.objects.filter(username='username2').exists())
+
+        # The session is kept for the retry
+        request = self.generate_request(factory.get('/confirm/email/{key}/'.format(key=session.session_key)))
+        response = views.confirm_email(request, data=converters.ConfirmEmail().to_python(session.session_key))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(User.objects.get(username='username2').check_password(
+            'a779894c60365e80efdfe0f7172ebe2063e99e08',
+        ))
+
+    @override_settings(TASKER_ACCOUNT_TOKEN_MODE='signed')
+    def test_views_confirm_email_signed(self):
+        factory = RequestFactory(HTTP_HOST='localhost')
+        request = factory.get('/')
+        request = self.generate_request(request)
+        sessions = Session.objects.count()
+
+        form = forms.Signup(data={
+            'username': 'username2',
+            'last_name': 'last_name',
+            'first_name': 'first_name',
+            'email': 'user@example.com',
+            'password1': 'a779894c60365e80efdfe0f7172ebe2063e99e08',
+            'password2': 'a779894c60365e80efdfe0f7172ebe2063e99e08'
+        }, request=request)
+        self.assertTrue(form.is_valid())
+
+        token = form.confirmation()
+        self.assertEqual(Session.objects.count(), sessions)
+        self.assertNotIn('a779894c60365e80efdfe0f7172ebe2063e99e08', token)
+        self.assertIn(token, mail.outbox.pop().body)
+
+        with self.assertRaises(ValueError):
+            converters.ConfirmEmail().to_python(token[:-1])
+
+        confirm_email = converters.ConfirmEmail().to_python(token)
+        request = factory.get('/confirm/email/{token}/'.format(token=token))
+        request = self.generate_request(request)
+        response = views.confirm_email(request, data=confirm_email)
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+
+        user = User.objects.get(username='username2')
+        self.assertEqual(user.email, 'user@example.com')
+        self.assertTrue(user.check_password('a779894c60365e80efdfe0f7172ebe2063e99e08'))
+
+        # Single use
+        self.assertFalse(converters.ConfirmEmail().to_python(token).consume())
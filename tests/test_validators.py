@@ -2,7 +2,7 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-from django_tasker_account import validators
+from django_tasker_account import validators, canonical
 
 
 class Validators(TestCase):
@@ -103,6 +103,36 @@ class Validators(TestCase):
         # Valid
         self.assertEqual(validators.email_dublicate('kazerogova@example.org'), 'kazerogova@example.org')
 
+        # The same gmail mailbox
+        User.objects.create_user(username='lilu', email='lilu.kazerogova@gmail.com')
+        with self.assertRaises(ValidationError):
+            validators.email_dublicate('LiluKazerogova+signup@googlemail.com')
+
+    def test_email_exists(self):
+        User.objects.create_user(username='kazerogova', email='kazerogova@yandex.ru')
+
+        self.assertEqual(validators.email_exists('kazerogova@ya.ru'), 'kazerogova@yandex.ru')
+        with self.assertRaises(ValidationError):
+            validators.email_exists('kazerogova@example.org')
+
+    def test_canonical(self):
+        self.assertEqual(canonical.normalize('  Kazerogova@YA.ru '), 'kazerogova@yandex.ru')
+        self.assertEqual(canonical.normalize('kaze.rogova+tag@gmail.com'), 'kaze.rogova+tag@gmail.com')
+
+        self.assertEqual(canonical.canonical('kaze.rogova+tag@gmail.com'), 'kazerogova@gmail.com')
+        self.assertEqual(canonical.canonical('kaze.rogova@googlemail.com'), 'kazerogova@gmail.com')
+        self.assertEqual(canonical.canonical('kazerogova+tag@yandex.com'), 'kazerogova@yandex.ru')
+        self.assertEqual(canonical.canonical('kaze.rogova+tag@example.com'), 'kaze.rogova+tag@example.com')
+        self.assertEqual(canonical.canonical(''), '')
+
+        user = User.objects.create_user(username='kazerogova', email='Kaze.Rogova@gmail.com')
+        self.assertEqual(user.profile.email_canonical, 'kazerogova@gmail.com')
+
+        user.email = 'kazerogova@example.com'
+        user.save()
+        user.profile.refresh_from_db()
+        self.assertEqual(user.profile.email_canonical, 'kazerogova@example.com')
+
     def test_email_blacklist(self):
         with self.assertRaises(ValidationError):
             validators.email_blacklist('example@2mailnext.com')